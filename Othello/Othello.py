@@ -1,10 +1,121 @@
 import struct, string
-from copy import deepcopy
+import random
+import sys
+import os
+import mmap
+import multiprocessing
 from time import time
 
+INFINITY = 10 ** 9 #larger than any score the search can return
+
+# The edge-play heuristic weight of every square, row by row: edges and
+# corners are worth holding, the squares next to them (which give the
+# opponent a way onto the edge) count against
+SQUARE_WEIGHTS = [11,  1,  6,  6,  6,  6,  1, 11,
+                   1, -9, -4, -4, -4, -4, -9,  1,
+                   6, -4,  1,  1,  1,  1, -4,  6,
+                   6, -4,  1,  1,  1,  1, -4,  6,
+                   6, -4,  1,  1,  1,  1, -4,  6,
+                   6, -4,  1,  1,  1,  1, -4,  6,
+                   1, -9, -4, -4, -4, -4, -9,  1,
+                  11,  1,  6,  6,  6,  6,  1, 11]
+
+# Raised by the search when it runs past its time limit, so that a half
+# finished search is thrown away instead of returning a meaningless score
+class SearchTimeout(Exception):
+    pass
+
+# Zobrist keys: a random 64-bit key for each player (1 or -1) on each square
+# (row * 8 + col), and one for white (-1) being the side to move. A position's
+# hash is the XOR of the keys of its discs, so playing or undoing a move only
+# XORs in the keys of the squares it changes
+ZOBRIST_RANDOM = random.Random(8)
+ZOBRIST_KEYS = {1: [ZOBRIST_RANDOM.getrandbits(64) for i in range(64)],
+                -1: [ZOBRIST_RANDOM.getrandbits(64) for i in range(64)]}
+ZOBRIST_FLIP = [ZOBRIST_KEYS[1][i] ^ ZOBRIST_KEYS[-1][i] for i in range(64)] #the change made by flipping a disc
+ZOBRIST_WHITE_TO_MOVE = ZOBRIST_RANDOM.getrandbits(64)
+
+# The kinds of score kept in a TranspositionTable entry: the exact score, or
+# a lower or upper bound on it from a search that failed high or low
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+
+# A fixed size table of search results keyed by Zobrist hash. Each slot holds
+# one (key, depth, bound, score, best move, generation) entry. The policy
+# decides what happens when a store lands on a slot held by another position:
+# "always" replaces it, while "depth" keeps it if it was stored during the
+# current search (see new_search) with a greater depth. A table should only
+# be shared by searches using the same evaluation
+class TranspositionTable:
+
+    def __init__(self, size = 1 << 18, policy = "depth"):
+        if (policy not in ("depth", "always")):
+            raise ValueError("Unknown replacement policy: " + str(policy))
+        self.size = size #the number of slots
+        self.policy = policy #the replacement policy, "depth" or "always"
+        self.entries = [None] * size #the entry in each slot, or None
+        self.generation = 0 #the number of the current search
+        self.probes = 0 #the number of lookups
+        self.hits = 0 #the lookups that found their position
+        self.misses = 0 #the lookups that didn't
+        self.cutoffs = 0 #the hits whose score ended the search of a node
+        self.stores = 0 #the entries written
+        self.replaced = 0 #the stores that overwrote another position's entry
+        self.rejected = 0 #the stores dropped to keep a deeper entry
+
+    # Start a new search, so entries from earlier searches can be replaced. The
+    # entries are kept, but the statistics start again from zero
+    def new_search(self):
+        self.generation += 1
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.cutoffs = 0
+        self.stores = 0
+        self.replaced = 0
+        self.rejected = 0
+
+    # Returns the entry stored for the position with the given key, or None
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries[key % self.size]
+        if (entry is not None and entry[0] == key):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    # Store the result of searching the position with the given key to depth,
+    # subject to the replacement policy
+    def store(self, key, depth, bound, score, move):
+        index = key % self.size
+        old = self.entries[index]
+        if (old is not None and old[0] != key):
+            if (self.policy == "depth" and old[5] == self.generation and old[1] > depth):
+                self.rejected += 1
+                return
+            self.replaced += 1
+        self.entries[index] = (key, depth, bound, score, move, self.generation)
+        self.stores += 1
+
+    # Empty the table and reset its statistics
+    def clear(self):
+        self.__init__(self.size, self.policy)
+
+    # Returns the hit/miss statistics of the current search and the number of
+    # slots in use
+    def stats(self):
+        return {"size": self.size, "used": self.size - self.entries.count(None),
+                "probes": self.probes, "hits": self.hits, "misses": self.misses,
+                "hit_rate": float(self.hits) / self.probes if self.probes else 0.0,
+                "cutoffs": self.cutoffs, "stores": self.stores,
+                "replaced": self.replaced, "rejected": self.rejected}
+
 class OthelloBoard:
 
     def __init__(self, h, c, hmarker, cmarker):
+        self.weights = SQUARE_WEIGHTS #the heuristic weight of each square (row * 8 + col)
         self.board = ([0] * 8, [0] * 8, [0] * 8, [0] * 8,
                       [0] * 8, [0] * 8, [0] * 8, [0] * 8)
         self.size = 8
@@ -19,7 +130,111 @@ class OthelloBoard:
         self.computer = c
         self.human_marker = hmarker
         self.comp_marker = cmarker
-        
+        self.hash = 0 #the Zobrist hash of the discs, kept up to date by play_square and undo
+        self.counts = {1: 0, -1: 0} #the number of discs of each player, kept up to date the same way
+        self.weight_sum = 0 #the weights of black's squares less those of white's, kept up to date the same way
+        self.recount()
+        self.tt = None #the TranspositionTable used by the search, or None
+        self.time_limit = 20 #the seconds the search may take for one move
+        self.nodes = 0 #the number of positions searched
+        self.ordering = True #order moves by killers, history and square weights (after the table's best move)
+        self.pvs = True #search every move after the first with a null window first (principal variation search)
+        self.killers = {} #the last two moves that caused a cutoff at each distance from the root
+        self.history = {1: {}, -1: {}} #the cutoff score of each move for each side, summed over the search
+        self.root_plies = 0 #the depth of the current search, counting the root moves
+        self.parallel = None #the ParallelSearch that root moves are shared out to, or None
+        self.endgame_empties = 10 #solve the game exactly once this many squares or fewer are empty
+        self.exact = False #whether the last iterative_deepening solved the game exactly
+        self.book = None #the OpeningBook make_cpu_move plays from before searching, or None
+
+    # The transposition table, process pool and opening book stay behind when the board is
+    # sent to another process
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["tt"] = None
+        state["parallel"] = None
+        state["book"] = None
+        return state
+
+    # Work out the hash, disc counts and weight sum of the board from scratch
+    def recount(self):
+        self.hash = self.zobrist_hash()
+        self.counts = {1: 0, -1: 0}
+        self.weight_sum = 0
+        for row in range(8):
+            for col in range(8):
+                square = self.get_square(col, row)
+                if (square != 0):
+                    self.counts[square] += 1
+                    self.weight_sum += square * self.weights[row * 8 + col]
+
+    # Use weights (64 numbers, row by row) as the heuristic weight of each square. a
+    # transposition table holding scores from the old weights should be cleared
+    def set_weights(self, weights):
+        if (len(weights) != 64):
+            raise ValueError("There must be a weight for each of the 64 squares")
+        self.weights = list(weights)
+        self.recount()
+
+    # Returns the Zobrist hash of the discs on the board, worked out from scratch
+    def zobrist_hash(self):
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                square = self.get_square(col, row)
+                if (square != 0):
+                    key ^= ZOBRIST_KEYS[square][row * 8 + col]
+        return key
+
+    # Returns the transposition table key of the position, with player to move
+    def position_key(self):
+        if (self.player == -1):
+            return self.hash ^ ZOBRIST_WHITE_TO_MOVE
+        return self.hash
+
+    # Store a search result in the transposition table, if there is one
+    def tt_store(self, key, depth, bound, score, move):
+        if (self.tt is not None):
+            self.tt.store(key, depth, bound, score, move)
+
+    # Returns the moves of the side to move in the order to search them with plies left to
+    # search: move (the best move found before, if it is one of them) first, then, if ordering
+    # is set, the killer moves for the same distance from the root and then the rest by the
+    # side's history score plus the weight of their square
+    def order_moves(self, moves, move, plies):
+        if (not self.ordering):
+            if (move is not None and move in moves):
+                moves.remove(move)
+                moves.insert(0, move)
+            return moves
+
+        killers = self.killers.get(self.root_plies - plies, ())
+        history = self.history[self.player]
+        ranked = []
+        for m in moves:
+            if (m == move):
+                rank = INFINITY
+            elif (m in killers):
+                rank = INFINITY - 1 - killers.index(m)
+            else:
+                rank = history.get(m, 0) + self.weights[m[0] * 8 + m[1]]
+            ranked.append((-1 * rank, m))
+        ranked.sort()
+        return [m for (rank, m) in ranked]
+
+    # Remember that the side to move's move caused a cutoff with plies left to search, as a
+    # killer move for its distance from the root and in the side's history scores (weighted
+    # towards deeper cutoffs)
+    def record_cutoff(self, move, plies):
+        if (not self.ordering):
+            return
+        killers = self.killers.setdefault(self.root_plies - plies, [])
+        if (move not in killers):
+            killers.insert(0, move)
+            del killers[2:]
+        history = self.history[self.player]
+        history[move] = history.get(move, 0) + plies * plies
+
     # swap player/opponent variables (for min/max value calculations)
     def swap(self):
         self.player *= -1
@@ -32,65 +247,272 @@ class OthelloBoard:
         return self
     
     #calculates minimax values (with alpha-beta pruning) and uses a heuristic (if provided)
+    #each move is made on this board and undone again after it has been searched, and the
+    #players are swapped back before returning, so the board is left as it was
+    #alpha and beta may be None for no bound. if there is a transposition table, a stored
+    #result at least as deep ends the search of the node, and a stored best move is tried first
+    #raises SearchTimeout once time_limit seconds have passed since orig_time. if pvs is set,
+    #every move after the first is searched with a null window, and only searched again with
+    #the full window if it turns out to be better than alpha
     def alphabeta_score(self, orig_time, max_plies, alpha, beta, heur = None):
-        self = self.swap()
-
-        if (max_plies == 0 or (time() - orig_time >= 20) or
-                self.has_move(self.player, self.opp) == False): 
-            if (heur != None):
-                return self.heuristic()
-            else:
-                return self.score()
-
-        possible_moves = self.get_moves(self.player, self.opp)
-        for move in possible_moves:
-            temp_board = deepcopy(self)
-            temp_board.play_square(move[1], move[0], self.player, self.opp)
-
+        self.swap()
+        try:
+            self.nodes += 1
+            if (time() - orig_time >= self.time_limit):
+                raise SearchTimeout()
+            if (max_plies == 0 or self.has_move(self.player, self.opp) == False): 
+                if (heur != None):
+                    return self.heuristic()
+                else:
+                    return self.score()
 
-            if (beta is not None):
-                optimal_alpha = -1 * beta
-            else:
-                optimal_alpha = None
+            if (alpha is None):
+                alpha = -INFINITY
+            if (beta is None):
+                beta = INFINITY
 
-            if (alpha is not None):
-                optimal_beta = -1 * alpha
-            else:
-                optimal_beta = None
+            key = self.position_key()
+            best_move = None
+            if (self.tt is not None):
+                entry = self.tt.probe(key)
+                if (entry is not None):
+                    (depth, bound, score, best_move) = entry[1:5]
+                    if (depth >= max_plies):
+                        if (bound == TT_EXACT or (bound == TT_LOWER and score >= beta) or
+                                (bound == TT_UPPER and score <= alpha)):
+                            self.tt.cutoffs += 1
+                            return min(max(score, alpha), beta)
 
-            optimal = -1 * temp_board.alphabeta_score(orig_time, max_plies - 1, optimal_alpha, optimal_beta, heur)
+            orig_alpha = alpha
+            possible_moves = self.order_moves(self.get_moves(self.player, self.opp), best_move, max_plies)
+            for move in possible_moves:
+                flipped = self.play_square(move[1], move[0], self.player, self.opp)
+                try:
+                    if (move is possible_moves[0] or not self.pvs):
+                        optimal = -1 * self.alphabeta_score(orig_time, max_plies - 1, -1 * beta, -1 * alpha, heur)
+                    else:
+                        optimal = -1 * self.alphabeta_score(orig_time, max_plies - 1, -1 * alpha - 1, -1 * alpha, heur)
+                        if (alpha < optimal and optimal < beta):
+                            optimal = -1 * self.alphabeta_score(orig_time, max_plies - 1, -1 * beta, -1 * alpha, heur)
+                finally:
+                    self.undo(move[1], move[0], flipped)
 
-            if (alpha is None or optimal > alpha):
-                alpha = optimal
+                if (optimal > alpha):
+                    (alpha, best_move) = (optimal, move)
 
-            if ((alpha is not None) and (beta is not None) and (alpha >= beta)):
-                return beta
+                if (alpha >= beta):
+                    self.record_cutoff(move, max_plies)
+                    self.tt_store(key, max_plies, TT_LOWER, beta, move)
+                    return beta
 
-        return alpha
+            if (alpha > orig_alpha):
+                self.tt_store(key, max_plies, TT_EXACT, alpha, best_move)
+            else:
+                self.tt_store(key, max_plies, TT_UPPER, alpha, best_move)
+            return alpha
+        finally:
+            self.swap()
 
     # finds the best move using minimax with alpha-beta pruning (and an optional heuristic)
+    # the best move stored in the transposition table (if any) is searched first, and the
+    # best move found is stored there in turn. raises SearchTimeout if the search runs out of time
     def alphabeta(self, orig_time, max_plies, heur = None):
         score_max = None
         move_max = None
 
-        possible_moves = self.get_moves(self.player, self.opp)
+        key = self.position_key()
+        possible_moves = self.root_moves(key, max_plies)
         for move in possible_moves:
-            temp_board = deepcopy(self)
-            temp_board.play_square(move[1], move[0], self.player, self.opp)
+            flipped = self.play_square(move[1], move[0], self.player, self.opp)
             if (score_max is not None):
                 optimal_beta = -1 * score_max
             else:
                 optimal_beta = None
 
-            optimal = -1 * temp_board.alphabeta_score(orig_time, max_plies, None, optimal_beta, heur)
+            try:
+                if (score_max is None or not self.pvs):
+                    optimal = -1 * self.alphabeta_score(orig_time, max_plies, None, optimal_beta, heur)
+                else:
+                    optimal = -1 * self.alphabeta_score(orig_time, max_plies, optimal_beta - 1, optimal_beta, heur)
+                    if (optimal > score_max):
+                        optimal = -1 * self.alphabeta_score(orig_time, max_plies, None, optimal_beta, heur)
+            finally:
+                self.undo(move[1], move[0], flipped)
             if (score_max is None or optimal > score_max):
                 (score_max, move_max) = (optimal, move)
 
-            if (time() - orig_time >= 20):
+        if (move_max is not None):
+            self.tt_store(key, max_plies + 1, TT_EXACT, score_max, move_max)
+        return (score_max, move_max)
+
+    # Returns the moves at the root of a search max_plies deep, in the order to search them,
+    # and starts counting distances from the root for the killer moves
+    def root_moves(self, key, max_plies):
+        self.root_plies = max_plies + 1
+        possible_moves = self.get_moves(self.player, self.opp)
+        best_move = None
+        if (self.tt is not None):
+            entry = self.tt.probe(key)
+            if (entry is not None):
+                best_move = entry[4]
+        return self.order_moves(possible_moves, best_move, max_plies + 1)
+
+    # finds the best move as alphabeta does, but shares the root moves out to the worker
+    # processes of parallel. the first (most promising) move is searched here, and the
+    # others are only started once its score is known, as a bound for them (young brothers
+    # wait). each worker raises the shared alpha as it finds better moves, so later
+    # searches can be cut off sooner. raises SearchTimeout if any move runs out of time
+    def parallel_alphabeta(self, orig_time, max_plies, parallel, heur = None):
+        key = self.position_key()
+        possible_moves = self.root_moves(key, max_plies)
+        if (len(possible_moves) == 0):
+            return (None, None)
+
+        move_max = possible_moves[0]
+        flipped = self.play_square(move_max[1], move_max[0], self.player, self.opp)
+        try:
+            score_max = -1 * self.alphabeta_score(orig_time, max_plies, None, None, heur)
+        finally:
+            self.undo(move_max[1], move_max[0], flipped)
+
+        parallel.alpha.value = score_max
+        if (heur is not None):
+            heur = 1 #the heuristic itself can't be sent to the workers, only whether to use it
+        jobs = [(self, move, max_plies, orig_time, heur) for move in possible_moves[1:]]
+        timed_out = False
+        for (move, score, nodes) in parallel.pool.imap(search_root_move, jobs):
+            self.nodes += nodes
+            if (score is None):
+                timed_out = True
+            elif (score > score_max):
+                (score_max, move_max) = (score, move)
+        if (timed_out):
+            raise SearchTimeout()
+
+        self.tt_store(key, max_plies + 1, TT_EXACT, score_max, move_max)
+        return (score_max, move_max)
+
+    # finds the best move by searching 1, 2, 3, ... plies deep with alphabeta until time_limit
+    # seconds have passed since orig_time, returning (score, move, plies) from the deepest
+    # search that finished. each search orders the moves by the results of the last one
+    # (through the transposition table, if there is one). a new search isn't started once
+    # half the time is gone, since it would likely not finish, or once it would reach past
+    # the end of the game (or past max_plies). if not even one ply could be searched in
+    # time, the first legal move is returned with a score of None and 0 plies. the killer
+    # moves and history scores are cleared at the start. if the board has a ParallelSearch,
+    # searches of 3 plies or more use parallel_alphabeta. with endgame_empties or fewer empty
+    # squares, the game is solved exactly instead, if that can be done in a quarter of the time
+    def iterative_deepening(self, orig_time, heur = None, max_plies = 60):
+        self.killers = {}
+        self.history = {1: {}, -1: {}}
+        self.exact = False
+        moves = self.get_moves(self.player, self.opp)
+        if (len(moves) == 0):
+            return (None, None, 0)
+        if (self.count_empty() <= self.endgame_empties):
+            try:
+                (score, move) = self.solve_endgame(orig_time + self.time_limit / 4.0)
+                self.exact = True
+                return (score, move, self.count_empty())
+            except SearchTimeout:
+                pass
+        (score, move, plies) = (None, moves[0], 0)
+        while (plies < min(max_plies, self.count_empty())):
+            try:
+                if (self.parallel is not None and plies >= 2):
+                    (score, move) = self.parallel_alphabeta(orig_time, plies, self.parallel, heur)
+                else:
+                    (score, move) = self.alphabeta(orig_time, plies, heur)
+            except SearchTimeout:
                 break
+            plies += 1
+            if (time() - orig_time >= self.time_limit / 2.0):
+                break
+        return (score, move, plies)
+
+    # Returns (score, move): the best move for player and the final disc difference (player's
+    # discs less opp's) it leads to with perfect play by both sides, passing whenever a side
+    # has no move. raises SearchTimeout if the time() passes deadline first
+    def solve_endgame(self, deadline):
+        empties = []
+        regions = [0] * 4
+        for row in range(self.size):
+            for col in range(self.size):
+                if (self.get_square(col, row) == 0):
+                    empties.append((row, col))
+                    regions[QUADRANTS[row * 8 + col]] += 1
 
+        (score_max, move_max) = (-INFINITY, None)
+        for move in self.parity_order(self.get_moves_in(empties, self.player, self.opp), regions):
+            score = -1 * self.endgame_move(deadline, move, empties, regions, -INFINITY, -1 * score_max)
+            if (score > score_max):
+                (score_max, move_max) = (score, move)
+        if (move_max is None):
+            return (None, None)
         return (score_max, move_max)
 
+    # Returns the exact final disc difference for player, as seen by player, searched with
+    # alpha-beta pruning. empties is the list of empty squares and regions the number of
+    # them in each quadrant of the board; both are kept up to date as moves are made and
+    # undone. passed is set if the other side has just passed, so that if player has no
+    # move either the game is over
+    def endgame_score(self, deadline, empties, regions, alpha, beta, passed):
+        self.nodes += 1
+        if (time() >= deadline):
+            raise SearchTimeout()
+
+        moves = self.get_moves_in(empties, self.player, self.opp)
+        if (len(moves) == 0):
+            if (passed or len(empties) == 0):
+                return self.score()
+            self.swap()
+            try:
+                return -1 * self.endgame_score(deadline, empties, regions, -1 * beta, -1 * alpha, True)
+            finally:
+                self.swap()
+
+        best = -INFINITY
+        for move in self.parity_order(moves, regions):
+            score = -1 * self.endgame_move(deadline, move, empties, regions, -1 * beta, -1 * alpha)
+            if (score > best):
+                best = score
+                if (best > alpha):
+                    alpha = best
+                    if (alpha >= beta):
+                        break
+        return best
+
+    # Make move for player, take it off the empty squares and returns the endgame_score of
+    # the position for opp, then take the move back again
+    def endgame_move(self, deadline, move, empties, regions, alpha, beta):
+        index = empties.index(move)
+        region = QUADRANTS[move[0] * 8 + move[1]]
+        flipped = self.play_square(move[1], move[0], self.player, self.opp)
+        empties.pop(index)
+        regions[region] -= 1
+        self.swap()
+        try:
+            return self.endgame_score(deadline, empties, regions, alpha, beta, False)
+        finally:
+            self.swap()
+            regions[region] += 1
+            empties.insert(index, move)
+            self.undo(move[1], move[0], flipped)
+
+    # Returns the (row, col) squares of empties where player can move
+    def get_moves_in(self, empties, player, opp):
+        return [e for e in empties if self.islegal(e[1], e[0], player, opp)]
+
+    # Returns moves in parity order: the moves in quadrants with an odd number of empty
+    # squares first (so the side to move gets the last move there), then by square weight
+    def parity_order(self, moves, regions):
+        return sorted(moves, key = lambda m: (regions[QUADRANTS[m[0] * 8 + m[1]]] % 2 == 0,
+                                              -1 * self.weights[m[0] * 8 + m[1]], m))
+
+    # Returns the number of empty squares on the board
+    def count_empty(self):
+        return 64 - self.counts[1] - self.counts[-1]
+
     #prints the board
     def PrintBoard(self):
 
@@ -117,28 +539,17 @@ class OthelloBoard:
         print(line_str)
 
     def board_full(self):
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.get_square(j, i) == 0:
-                    return False
-        return True
+        return self.counts[1] + self.counts[-1] == 64
 
     #determines the score of the board by adding +1 for every tile owned by player, and -1 for every tile owned by opp
     def score(self):
-        score = 0
-        for i in range(self.size):
-            for j in range(self.size):
-                score += self.get_square(j, i)
-        return score * self.player
+        return (self.counts[1] - self.counts[-1]) * self.player
 
     def final_score(self):
-        score = 0
-        for i in range(self.size):
-            for j in range(self.size):
-                score += self.get_square(j, i)
-        return score
+        return self.counts[1] - self.counts[-1]
 
-    #returns true if the square was played, false if the move is not allowed
+    #returns the (row, col) squares flipped if the square was played, false if the move is not allowed.
+    #passing the flipped squares to undo takes the move back again
     def play_square(self, col, row, player, opp):
         if (self.get_square(col, row) != 0):
             return False
@@ -147,7 +558,7 @@ class OthelloBoard:
             print("player and opponent cannot be the same")
             return False
 
-        legal = False
+        flipped = []
         #for each direction, check to see if the move is legal by seeing if the adjacent square
         #in that direction is occuipied by the opponent. If it isnt check the next direction.
         #if it is, check to see if one of the players pieces is on the board beyond the oppponent's piece,
@@ -170,24 +581,57 @@ class OthelloBoard:
 
                     #with one of player's pieces at the other end
                     if self.get_square(col + i * Dir[1], row + i * Dir[0]) == player and i != 0 and i != 1:
-                        #set a flag so we know that the move was legal
-                        legal = True
-                        self.flip_tiles(row, col, Dir, i, player)
+                        #remember the flipped squares so we know that the move was legal
+                        flipped.extend(self.flip_tiles(row, col, Dir, i, player))
                         break
-                        
-        return legal
+
+        if (len(flipped) == 0):
+            return False
+        self.hash ^= ZOBRIST_KEYS[player][row * 8 + col]
+        self.counts[player] += 1
+        self.weight_sum += player * self.weights[row * 8 + col]
+        for (r, c) in flipped:
+            self.hash ^= ZOBRIST_FLIP[r * 8 + c]
+            self.weight_sum += 2 * player * self.weights[r * 8 + c]
+        self.counts[player] += len(flipped)
+        self.counts[-1 * player] -= len(flipped)
+        return flipped
 
 # Sets all tiles along a given direction (Dir) from a given starting point (col and row) for a given distance
-# (dist) to be a given value ( player )
+# (dist) to be a given value ( player ), returning the squares flipped (all but the starting point)
     def flip_tiles(self, row, col, Dir, dist, player):
         for i in range(dist):
             self.board[row+ i*Dir[0]][col + i*Dir[1]] = player
-        return True
+        return [(row + i * Dir[0], col + i * Dir[1]) for i in range(1, dist)]
+
+# Takes back the move played on the square at col and row, given the squares it flipped
+# (as returned by play_square), giving them back to the opponent
+    def undo(self, col, row, flipped):
+        player = self.board[row][col]
+        for (r, c) in flipped:
+            self.board[r][c] = -1 * player
+            self.hash ^= ZOBRIST_FLIP[r * 8 + c]
+            self.weight_sum -= 2 * player * self.weights[r * 8 + c]
+        self.counts[player] -= len(flipped)
+        self.counts[-1 * player] += len(flipped)
+        self.board[row][col] = 0
+        self.hash ^= ZOBRIST_KEYS[player][row * 8 + col]
+        self.counts[player] -= 1
+        self.weight_sum -= player * self.weights[row * 8 + col]
     
 # Returns the value of a square on the board
     def get_square(self, col, row):
         return self.board[row][col]
 
+# Returns the squares held by player as a bitboard, bit row * 8 + col for square (row, col)
+    def discs(self, player):
+        mask = 0
+        for i in range(self.size):
+            for j in range(self.size):
+                if (self.board[i][j] == player):
+                    mask |= 1 << (i * 8 + j)
+        return mask
+
 # Checks all board positions to see if there is a legal move
     def has_move(self, player, opp):
         for i in range(self.size):
@@ -231,20 +675,11 @@ class OthelloBoard:
 
 # Returns true if no square in the board contains 0, false otherwise
     def full_board(self):
-        for i in range(self.size):
-            for j in range(self.size):
-                if(self.board[i][j] == 0):
-                    return False
-
-        return True
+        return self.counts[1] + self.counts[-1] == 64
     
 # Checks to see if the given player controls the entire board
     def all_pieces(self, player):
-        for i in range(self.size):
-            for j in range(self.size):
-                if(self.get_square(j, i) != player and self.get_square(j, i) != 0):
-                    return False
-        return True
+        return self.counts[-1 * player] == 0
                    
     # Check to see if the game is over
     def game_over(self):
@@ -252,7 +687,8 @@ class OthelloBoard:
             return True
         return False
 
-    # Utilize an edge-play heuristic
+    # Utilize an edge-play heuristic: the weights of player's squares less those of opp's,
+    # which play_square and undo keep up to date, or +/-1000000 once the game is over
     def heuristic(self):
         if (self.game_over()):
             score = self.score()
@@ -262,84 +698,477 @@ class OthelloBoard:
                 return -1000000
             else:
                 return 0
+        return self.weight_sum * self.player
 
-        opponent = -1 * self.player
-        score = 0
-        for i in range(self.size):
-            for j in range(self.size):
-                heur = 1
-                if (i == 0 or i == (self.size - 1)):
-                    heur += 5
-                if (j == 0 or j == (self.size - 1)):
-                    heur += 5
-                if (i == 1 or i == (self.size - 2)):
-                     heur -= 5
-                if (j == 1 or j == (self.size - 2)):
-                    heur -= 5
-
-#                if ((i == 0 or i == (self.size - 1)) and
-#                        (j == 0 or j == (self.size - 1))):
-#                    heur += 49
-#                if (i == 1 and j == 1):
-#                    if (self.get_square(0, 0) == self.player):
-#                        heur += 1
-#                    else:
-#                        heur -= 11
-#                if (i == (self.size - 2) and j == 1):
-#                    if (self.get_square((self.size - 1), 0) == self.player):
-#                        heur += 1
-#                    else:
-#                        heur -= 11
-#                if (i == 1 and j == (self.size - 2)):
-#                    if (self.get_square(0, (self.size - 1)) == self.player):
-#                        heur += 1
-#                    else:
-#                        heur -= 11
-#                if (i == (self.size - 2) and j == (self.size - 2)):
-#                    if (self.get_square((self.size - 1), (self.size - 1)) == self.player):
-#                        heur += 1
-#                    else:
-#                        heur -= 11
-#                if ((i == 1 or i == (self.size - 2)) and
-#                        (j == 0 or j == (self.size - 1))):
-#                    heur -= 2
-#                if ((i == 0 or i == (self.size - 1)) and
-#                        (j == 1 or j == (self.size - 2))):
-#                    heur -= 2
-#                if ((i == 2 or i == (self.size - 3)) and
-#                        (j == 0 or j == (self.size - 1))):
-#                    heur += 4
-#                if ((i == 0 or i == (self.size - 1)) and
-#                        (j == 2 or j == (self.size - 3))):
-#                    heur += 4
-
-                if self.board[i][j] == self.player:
-                    score += heur
-#                    print ("adding this score")
-#                    print (i, j)
-                elif self.board[i][j] == self.opp:
-                    score -= heur
-#                    print ("subtracting this score")
-#                    print (i, j)
-
-        return score
-
-# make a cpu move, in this case, using minimax with alpha/beta and an edge-play heuristic
+FULL_BOARD = (1 << 64) - 1 #a bitboard with every square set
+NOT_COL_0 = FULL_BOARD ^ sum(1 << (row * 8) for row in range(8)) #every square but those in column 0
+NOT_COL_7 = FULL_BOARD ^ sum(1 << (row * 8 + 7) for row in range(8)) #every square but those in column 7
+
+# For each of the eight directions, the shift that moves a bitboard one
+# square that way (square (row, col) is bit row * 8 + col) and the mask that
+# clears the squares that wrapped around from the other side of the board
+DIRECTION_SHIFTS = []
+for (drow, dcol) in [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]:
+    if (dcol == 1):
+        mask = NOT_COL_0
+    elif (dcol == -1):
+        mask = NOT_COL_7
+    else:
+        mask = FULL_BOARD
+    DIRECTION_SHIFTS.append((drow * 8 + dcol, mask))
+
+# Move every square of the bitboard x one square in the direction given by
+# shift and mask (see DIRECTION_SHIFTS)
+def shift_board(x, shift, mask):
+    if (shift > 0):
+        return (x << shift) & mask
+    return (x >> -shift) & mask
+
+# The quadrant (0 to 3) of every square (row * 8 + col), for parity move ordering
+QUADRANTS = [(row // 4) * 2 + (col // 4) for row in range(8) for col in range(8)]
+
+# An OthelloBoard that keeps each side's discs in one 64-bit integer, bit
+# row * 8 + col for square (row, col), and finds legal moves and flips for all
+# eight directions at once with shifts and masks. It plays exactly as
+# OthelloBoard does, so the search runs on it unchanged
+class BitboardOthelloBoard(OthelloBoard):
+
+    def __init__(self, h, c, hmarker, cmarker):
+        OthelloBoard.__init__(self, h, c, hmarker, cmarker)
+        self.black = (1 << (4 * 8 + 4)) | (1 << (3 * 8 + 3)) #the squares held by black (1)
+        self.white = (1 << (3 * 8 + 4)) | (1 << (4 * 8 + 3)) #the squares held by white (-1)
+        self.recount()
+
+    # The board as a tuple of row lists, as OthelloBoard keeps it. Changing
+    # the lists doesn't change the board, but the board can be replaced
+    @property
+    def board(self):
+        return tuple([self.get_square(col, row) for col in range(8)] for row in range(8))
+
+    @board.setter
+    def board(self, rows):
+        self.black = 0
+        self.white = 0
+        for row in range(8):
+            for col in range(8):
+                if (rows[row][col] == 1):
+                    self.black |= 1 << (row * 8 + col)
+                elif (rows[row][col] == -1):
+                    self.white |= 1 << (row * 8 + col)
+        self.recount()
+
+    # Returns the bitboard of the squares held by player (1 or -1)
+    def discs(self, player):
+        if (player == 1):
+            return self.black
+        elif (player == -1):
+            return self.white
+        return 0
+
+    # Returns the bitboard of every legal move for player against opp
+    def move_mask(self, player, opp):
+        mine = self.discs(player)
+        theirs = self.discs(opp)
+        empty = FULL_BOARD & ~(mine | theirs)
+        moves = 0
+        for shift, mask in DIRECTION_SHIFTS:
+            x = shift_board(mine, shift, mask) & theirs
+            for i in range(5):
+                x |= shift_board(x, shift, mask) & theirs
+            moves |= shift_board(x, shift, mask) & empty
+        return moves
+
+    # Returns the bitboard of the discs that player placing a disc on the
+    # square bit would flip (0 if the move is illegal)
+    def flip_mask(self, bit, player, opp):
+        mine = self.discs(player)
+        theirs = self.discs(opp)
+        flips = 0
+        for shift, mask in DIRECTION_SHIFTS:
+            line = 0
+            x = shift_board(bit, shift, mask)
+            while (x & theirs):
+                line |= x
+                x = shift_board(x, shift, mask)
+            if (x & mine):
+                flips |= line
+        return flips
+
+    #returns the bitboard of the discs flipped if the square was played, false if the move is
+    #not allowed. passing the flipped discs to undo takes the move back again
+    def play_square(self, col, row, player, opp):
+        bit = 1 << (row * 8 + col)
+        if ((self.black | self.white) & bit):
+            return False
+
+        if (player == opp):
+            print("player and opponent cannot be the same")
+            return False
+
+        flips = self.flip_mask(bit, player, opp)
+        if (flips == 0):
+            return False
+        if (player == 1):
+            self.black |= flips | bit
+            self.white &= ~flips
+        else:
+            self.white |= flips | bit
+            self.black &= ~flips
+        (key, weight, count) = self.flips_changes(flips)
+        self.hash ^= ZOBRIST_KEYS[player][row * 8 + col] ^ key
+        self.weight_sum += player * (self.weights[row * 8 + col] + 2 * weight)
+        self.counts[player] += count + 1
+        self.counts[-1 * player] -= count
+        return flips
+
+    # Returns (the change to the Zobrist hash, the sum of the weights, the number of discs)
+    # for the discs in flips
+    def flips_changes(self, flips):
+        key = 0
+        weight = 0
+        count = 0
+        weights = self.weights
+        while (flips):
+            bit = flips & -flips
+            flips ^= bit
+            index = bit.bit_length() - 1
+            key ^= ZOBRIST_FLIP[index]
+            weight += weights[index]
+            count += 1
+        return (key, weight, count)
+
+# Takes back the move played on the square at col and row, given the bitboard of the discs
+# it flipped (as returned by play_square)
+    def undo(self, col, row, flipped):
+        bit = 1 << (row * 8 + col)
+        if (self.black & bit):
+            player = 1
+            self.black &= ~(flipped | bit)
+            self.white |= flipped
+        else:
+            player = -1
+            self.white &= ~(flipped | bit)
+            self.black |= flipped
+        (key, weight, count) = self.flips_changes(flipped)
+        self.hash ^= ZOBRIST_KEYS[player][row * 8 + col] ^ key
+        self.weight_sum -= player * (self.weights[row * 8 + col] + 2 * weight)
+        self.counts[player] -= count + 1
+        self.counts[-1 * player] += count
+
+# Returns the value of a square on the board
+    def get_square(self, col, row):
+        bit = 1 << (row * 8 + col)
+        if (self.black & bit):
+            return 1
+        elif (self.white & bit):
+            return -1
+        return 0
+
+    def has_move(self, player, opp):
+        return self.move_mask(player, opp) != 0
+
+    # Returns the legal moves as (row, col) pairs, in the same order as
+    # OthelloBoard.get_moves
+    def get_moves(self, player, opp):
+        moves = []
+        x = self.move_mask(player, opp)
+        while (x):
+            bit = x & -x
+            x ^= bit
+            index = bit.bit_length() - 1
+            moves.append((index >> 3, index & 7))
+        return moves
+
+    def islegal(self, col, row, player, opp):
+        return (self.move_mask(player, opp) >> (row * 8 + col)) & 1 == 1
+
+    # Returns the (row, col) squares of empties where player can move, finding every legal
+    # move at once
+    def get_moves_in(self, empties, player, opp):
+        moves = self.move_mask(player, opp)
+        return [e for e in empties if (moves >> (e[0] * 8 + e[1])) & 1]
+
+# The eight symmetries of the board (the rotations and reflections), each as the square
+# (row * 8 + col) that every square moves to
+SYMMETRIES = []
+for transform in [lambda r, c: (r, c), lambda r, c: (c, 7 - r), lambda r, c: (7 - r, 7 - c),
+                  lambda r, c: (7 - c, r), lambda r, c: (r, 7 - c), lambda r, c: (7 - r, c),
+                  lambda r, c: (c, r), lambda r, c: (7 - c, 7 - r)]:
+    SYMMETRIES.append([transform(sq // 8, sq % 8)[0] * 8 + transform(sq // 8, sq % 8)[1] for sq in range(64)])
+INVERSE_SYMMETRIES = [[s.index(sq) for sq in range(64)] for s in SYMMETRIES] #the square each square comes from
+
+# Returns the bitboard x with every square moved by the symmetry s
+def transform_board(x, s):
+    y = 0
+    while (x):
+        bit = x & -x
+        x ^= bit
+        y |= 1 << s[bit.bit_length() - 1]
+    return y
+
+# Returns (mine, theirs, symmetry) for the position where the side to move holds the
+# bitboard mine and the other side theirs: the smallest of its eight symmetric versions,
+# which every symmetric position shares, and the index of the symmetry that gives it
+def canonical_position(mine, theirs):
+    best = None
+    for i in range(len(SYMMETRIES)):
+        key = (transform_board(mine, SYMMETRIES[i]), transform_board(theirs, SYMMETRIES[i]), i)
+        if (best is None or key < best):
+            best = key
+    return best
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Othello.book") #the book play uses
+BOOK_MAGIC = b"OTHBOOK1"
+BOOK_HEADER = struct.Struct("<8sII") #the magic, the number of positions and the plies each was searched
+BOOK_RECORD = struct.Struct("<QQBi") #a canonical position (mover's discs, other discs), its move's square and score
+
+# An opening book: the best move found by the engine for each position early in the game, read
+# from a file written by build_book. The file holds the positions in canonical form (see
+# canonical_position), sorted, so symmetric positions share a record and a position is found by
+# binary search. The file is only opened, and memory-mapped, on the first lookup
+class OpeningBook:
+
+    def __init__(self, path = BOOK_PATH):
+        self.path = path #the book file
+        self.data = None #the memory-mapped file, once opened
+        self.size = 0 #the number of positions in the book
+        self.loaded = False #whether the file has been looked for
+
+    # Memory-map the book file. A missing or unreadable file leaves the book empty
+    def load(self):
+        self.loaded = True
+        try:
+            with open(self.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        if (len(data) < BOOK_HEADER.size):
+            data.close()
+            return
+        (magic, size, plies) = BOOK_HEADER.unpack_from(data, 0)
+        if (magic != BOOK_MAGIC or len(data) != BOOK_HEADER.size + size * BOOK_RECORD.size):
+            data.close()
+            return
+        self.data = data
+        self.size = size
+
+    # Returns ((row, col), score) for the book move of the side to move on board, or None if
+    # the position isn't in the book
+    def lookup(self, board):
+        if (not self.loaded):
+            self.load()
+        if (self.size == 0):
+            return None
+        (mine, theirs, symmetry) = canonical_position(board.discs(board.player), board.discs(board.opp))
+        low = 0
+        high = self.size
+        while (low < high):
+            middle = (low + high) // 2
+            (book_mine, book_theirs, square, score) = BOOK_RECORD.unpack_from(self.data, BOOK_HEADER.size + middle * BOOK_RECORD.size)
+            if ((book_mine, book_theirs) < (mine, theirs)):
+                low = middle + 1
+            elif ((book_mine, book_theirs) > (mine, theirs)):
+                high = middle
+            else:
+                square = INVERSE_SYMMETRIES[symmetry][square]
+                return ((square // 8, square % 8), score)
+        return None
+
+    # Unmap the book file
+    def close(self):
+        if (self.data is not None):
+            self.data.close()
+            self.data = None
+        self.size = 0
+
+# make a cpu move, in this case, from the opening book if the position is in it, or else using
+# iterative deepening minimax with alpha/beta and an edge-play heuristic, taking at most
+# board.time_limit seconds from t. the board keeps its transposition table from move to move
 def make_cpu_move(board, t):
-    score, move = board.alphabeta(t, 8, lambda: heuristic)
+    if (board.book is not None):
+        entry = board.book.lookup(board)
+        if (entry is not None and board.islegal(entry[0][1], entry[0][0], board.player, board.opp)):
+            (move, score) = entry
+            board.play_square(move[1], move[0], board.player, board.opp)
+            print("CPU played row: " + str(move[0]) + " col: " + str(move[1]) + " from the opening book, which had a score of " + str(score))
+            return
+    if (board.tt is None):
+        board.tt = TranspositionTable()
+    board.tt.new_search()
+    board.nodes = 0
+    score, move, plies = board.iterative_deepening(t, lambda: heuristic)
+    elapsed = max(time() - t, 0.000001)
     board.play_square(move[1], move[0], board.player, board.opp)
     print("CPU played row: " + str(move[0]) + " col: " + str(move[1]) + ", which had a score of " + str(score))
+    if (board.exact):
+        print("Solved the endgame exactly: the final disc difference will be " + str(score))
+    print("Searched " + str(plies) + " plies deep, " + str(board.nodes) + " nodes in " +
+          str(round(elapsed, 2)) + " seconds (" + str(int(board.nodes / elapsed)) + " nodes/sec)")
+    stats = board.tt.stats()
+    print("Transposition table: " + str(stats["hits"]) + " hits, " + str(stats["misses"]) + " misses, " +
+          str(stats["used"]) + " of " + str(stats["size"]) + " slots used")
+
+# A pool of worker processes for OthelloBoard.parallel_alphabeta, with the alpha bound
+# they share. Each worker keeps its own transposition table from search to search
+class ParallelSearch:
+
+    def __init__(self, processes = None):
+        self.alpha = multiprocessing.Value("q", -INFINITY) #the best root score found so far
+        self.pool = multiprocessing.Pool(processes, init_search_worker, (self.alpha,)) #the worker processes
+
+    # Stop the worker processes
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+# Set up a worker process of a ParallelSearch, given the shared alpha bound
+def init_search_worker(alpha):
+    global SHARED_ALPHA, WORKER_TT
+    SHARED_ALPHA = alpha
+    WORKER_TT = TranspositionTable()
+
+# Worker for parallel_alphabeta: search one root move max_plies deep. The job holds the
+# board, the move, max_plies, the search's start time and whether to use the heuristic.
+# Moves that can't beat the shared alpha are searched with a null window, and only searched
+# in full if they can. Returns (move, score, nodes searched), with a score of None if the
+# search ran out of time
+def search_root_move(job):
+    (board, move, max_plies, orig_time, heur) = job
+    board.tt = WORKER_TT
+    board.tt.new_search()
+    board.nodes = 0
+    alpha = SHARED_ALPHA.value
+    flipped = board.play_square(move[1], move[0], board.player, board.opp)
+    try:
+        if (board.pvs):
+            score = -1 * board.alphabeta_score(orig_time, max_plies, -1 * alpha - 1, -1 * alpha, heur)
+            if (score > alpha):
+                score = -1 * board.alphabeta_score(orig_time, max_plies, None, -1 * alpha, heur)
+        else:
+            score = -1 * board.alphabeta_score(orig_time, max_plies, None, -1 * alpha, heur)
+    except SearchTimeout:
+        return (move, None, board.nodes)
+    finally:
+        board.undo(move[1], move[0], flipped)
+
+    with SHARED_ALPHA.get_lock():
+        if (score > SHARED_ALPHA.value):
+            SHARED_ALPHA.value = score
+    return (move, score, board.nodes)
+
+# Fixed positions for comparing search variants, as (seed, number of random moves played
+# from the start)
+BENCH_POSITIONS = [(1, 10), (2, 16), (3, 22), (4, 28)]
 
-# main play-loop for the game
-def play(h, c, hmarker, cmarker, p, o):
+# Returns the position reached by playing moves random legal moves (with the given seed)
+# from the start, passing when a side has no move
+def bench_position(seed, moves):
+    rng = random.Random(seed)
+    b = BitboardOthelloBoard(1, -1, 'B', 'W')
+    b.player = 1
+    b.opp = -1
+    for i in range(moves):
+        possible_moves = b.get_moves(b.player, b.opp)
+        if (len(possible_moves) > 0):
+            move = rng.choice(possible_moves)
+            b.play_square(move[1], move[0], b.player, b.opp)
+        b.swap()
+    return b
 
-    b = OthelloBoard(h, c, hmarker, cmarker)
+# Search every bench position plies deep with the edge-play heuristic, first with plain
+# alpha-beta in board order (as the search used to be), then by iterative deepening with a
+# transposition table and move ordering, then adding principal variation search, and print
+# the nodes searched by each
+def compare_search(plies = 6):
+    variants = [("alpha-beta", False, False), ("ordered", True, False), ("ordered + pvs", True, True)]
+    totals = [0] * len(variants)
+    for (seed, moves) in BENCH_POSITIONS:
+        for v in range(len(variants)):
+            (name, ordering, pvs) = variants[v]
+            b = bench_position(seed, moves)
+            b.time_limit = INFINITY
+            b.ordering = ordering
+            b.pvs = pvs
+            start = time()
+            if (ordering):
+                b.tt = TranspositionTable()
+                score, move, depth = b.iterative_deepening(start, 1, plies)
+            else:
+                b.tt = None
+                score, move = b.alphabeta(start, plies - 1, 1)
+            totals[v] += b.nodes
+            print("position " + str(seed) + "/" + str(moves) + " " + name + ": " + str(b.nodes) + " nodes, score " +
+                  str(score) + ", move " + str(move) + ", " + str(round(time() - start, 2)) + " seconds")
+    for v in range(len(variants)):
+        print(variants[v][0] + ": " + str(totals[v]) + " nodes in total")
+
+# Search every position reachable in the first plies moves of the game search_plies deep
+# with the edge-play heuristic and write the best moves to an opening book at path. Positions
+# are stored once for all their symmetric versions
+def build_book(path = BOOK_PATH, plies = 6, search_plies = 8):
+    b = BitboardOthelloBoard(1, -1, 'B', 'W')
+    b.player = 1
+    b.opp = -1
+    b.time_limit = INFINITY
+    b.tt = TranspositionTable()
+    positions = {}
+    frontier = [b]
+    start = time()
+    for ply in range(plies):
+        next_frontier = []
+        for position in frontier:
+            (mine, theirs, symmetry) = canonical_position(position.discs(position.player), position.discs(position.opp))
+            if ((mine, theirs) in positions or not position.has_move(position.player, position.opp)):
+                continue
+            position.tt = b.tt
+            position.tt.new_search()
+            score, move, depth = position.iterative_deepening(time(), 1, search_plies)
+            positions[(mine, theirs)] = (SYMMETRIES[symmetry][move[0] * 8 + move[1]], score)
+            for m in position.get_moves(position.player, position.opp):
+                child = BitboardOthelloBoard(1, -1, 'B', 'W')
+                child.black = position.black
+                child.white = position.white
+                child.recount()
+                child.player = position.player
+                child.opp = position.opp
+                child.time_limit = INFINITY
+                child.play_square(m[1], m[0], child.player, child.opp)
+                child.swap()
+                next_frontier.append(child)
+        frontier = next_frontier
+        print("ply " + str(ply) + ": " + str(len(positions)) + " positions, " + str(round(time() - start, 2)) + " seconds")
+
+    with open(path, "wb") as f:
+        f.write(BOOK_HEADER.pack(BOOK_MAGIC, len(positions), search_plies))
+        for key in sorted(positions):
+            f.write(BOOK_RECORD.pack(key[0], key[1], positions[key][0], positions[key][1]))
+    print("Wrote " + str(len(positions)) + " positions to " + path)
+
+# main play-loop for the game. the computer takes up to seconds per move, searching
+# with a pool of processes if processes is more than 1, and plays from the opening book
+# while it can
+def play(h, c, hmarker, cmarker, p, o, seconds = 20, processes = 1):
+
+    b = BitboardOthelloBoard(h, c, hmarker, cmarker)
+    b.time_limit = seconds
+    b.player = p
+    b.opp = o
+    b.book = OpeningBook()
+    if (processes > 1):
+        b.parallel = ParallelSearch(processes)
+    try:
+        play_game(b, h, c, hmarker)
+    finally:
+        b.book.close()
+        if (b.parallel is not None):
+            b.parallel.close()
+
+# alternate turns on the board b until the game is over
+def play_game(b, h, c, hmarker):
     b.PrintBoard()
 
     Human = h
     CPU = c
-    b.player = p
-    b.opp = o
 
     #alternate between human's turn and CPU turn. if theres is no available move for one of the players, then
     #it becomes their opponent's turn again.
@@ -411,8 +1240,35 @@ def play(h, c, hmarker, cmarker, p, o):
         else:
             print ("Congratulations, you win!")
 
+# Usage: python Othello.py [seconds per computer move] [search processes]
+#        python Othello.py bench [plies]
+#        python Othello.py book [plies] [search plies]
 def main():
     test_input = -1
+    seconds = 20
+    processes = 1
+    if (len(sys.argv) > 1 and sys.argv[1] == "bench"):
+        try:
+            compare_search(int(sys.argv[2]) if len(sys.argv) > 2 else 6)
+        except ValueError:
+            print ("Invalid number of plies")
+        return
+    if (len(sys.argv) > 1 and sys.argv[1] == "book"):
+        try:
+            build_book(BOOK_PATH, *[int(arg) for arg in sys.argv[2:4]])
+        except ValueError:
+            print ("Invalid number of plies")
+        return
+    if (len(sys.argv) > 1):
+        try:
+            seconds = float(sys.argv[1])
+        except ValueError:
+            print ("Invalid time limit, using " + str(seconds) + " seconds")
+    if (len(sys.argv) > 2):
+        try:
+            processes = int(sys.argv[2])
+        except ValueError:
+            print ("Invalid number of processes, searching in one process")
 
     # Validate user input
     while (test_input == -1):
@@ -429,7 +1285,7 @@ def main():
                 CPU_char = 'W'
                 player = Human
                 opp = CPU
-                play(Human, CPU, Human_char, CPU_char, player, opp)
+                play(Human, CPU, Human_char, CPU_char, player, opp, seconds, processes)
             elif (player == 2):
                 Human = -1
                 CPU = 1
@@ -437,7 +1293,7 @@ def main():
                 CPU_char = 'B'
                 player = CPU
                 opp = Human
-                play(Human, CPU, CPU_char, Human_char, player, opp) #play(Human, CPU, CPU_char, Human_char, player, opp)
+                play(Human, CPU, CPU_char, Human_char, player, opp, seconds, processes) #play(Human, CPU, CPU_char, Human_char, player, opp)
             else:
                 print ("Please enter either 1 or 2")
                 test_input = -1
@@ -1,12 +1,190 @@
 #!/usr/bin
 # Sudoku solver
 # Authors: Josiah Matlack and Jason Lee
-# Usage: python Sudoku.py <filename> <b, f>
+# Usage: python Sudoku.py <filename> <b, f, m, p, d> [flat]
+#        python Sudoku.py <filename> r
+#        python Sudoku.py batch <directory, glob or - for stdin> <b, f, m, p, d> [max checks] [seconds] [processes] [max nodes]
+#        python Sudoku.py count <filename> [limit]
+#        python Sudoku.py generate <size> <count> <output file> [processes] [seed]
+#        python Sudoku.py benchmark <output.json> [modes] [seconds]
+#        python Sudoku.py compare <baseline.json> <current.json> [threshold]
 
 import struct, string, math
 import sys
-import copy
+import os
+import bisect
 import time
+import glob
+import json
+import random
+import tracemalloc
+import multiprocessing
+from collections import deque
+
+# Raised by the solvers when a search runs out of its SolveBudget. The
+# message names the limit that ran out: "checks", "nodes" or "time"
+class SearchLimitExceeded(Exception):
+    pass
+
+# The limits on a single solve: the most consistency checks and nodes
+# expanded the board may reach, and the wall clock seconds the search may
+# take. Any of them may be None for no limit. The clock starts when a solver
+# is first handed the budget
+class SolveBudget:
+
+    # The constructor for the SolveBudget
+    def __init__(self, max_checks = None, max_nodes = None, seconds = None):
+        self.max_checks = max_checks #the consistency check cap, or None
+        self.max_nodes = max_nodes #the nodes expanded cap, or None
+        self.seconds = seconds #the time limit in seconds, or None
+        self.deadline = None #the time.time() the search must finish by, once started
+
+    # Start the clock, unless it is already running
+    def start(self):
+        if (self.deadline is None and self.seconds is not None):
+            self.deadline = time.time() + self.seconds
+        return self
+
+    # Get a copy of the budget with the clock not yet started
+    def fresh(self):
+        return SolveBudget(self.max_checks, self.max_nodes, self.seconds)
+
+    # Get the name of the limit that checks and nodes (or the clock) have run
+    # past, or None if the search is still within budget
+    def exceeded(self, checks, nodes):
+        if (self.max_checks is not None and checks > self.max_checks):
+            return "checks"
+        if (self.max_nodes is not None and nodes > self.max_nodes):
+            return "nodes"
+        if (self.deadline is not None and time.time() > self.deadline):
+            return "time"
+        return None
+
+# The outcome of a single solve: whether the board was solved, its status
+# ("solved", "no solution" or "budget exceeded"), the budget limit that ran
+# out (or None), the consistency checks, nodes expanded and seconds used, and
+# the board's stats record (see SudokuBoard.stats_record), or None
+class SolveResult:
+
+    # The constructor for the SolveResult
+    def __init__(self, solved, status, reason, checks, nodes, seconds, stats = None):
+        self.solved = solved
+        self.status = status
+        self.reason = reason
+        self.checks = checks
+        self.nodes = nodes
+        self.seconds = seconds
+        self.stats = stats
+
+    # Get the result as a dictionary, for JSON result records
+    def as_record(self):
+        return {"solved": self.solved, "status": self.status, "reason": self.reason,
+                "checks": self.checks, "nodes": self.nodes, "seconds": self.seconds,
+                "stats": self.stats}
+
+# The search statistics of a SudokuBoard, beyond its ConsistencyChecks and
+# NodesExpanded counters. Callbacks can be hooked onto the events
+#   "node"      (board, row, col, num, depth) a value is placed by the search
+#   "backtrack" (board, row, col, depth) the search gives up on a square
+#   "wipeout"   (board, square) forward checking or propagation empties a
+#               domain (square is None when a unit has no place for a value)
+#   "phase"     (board, name, seconds) a phase of the solve has finished
+# so a profiler can follow the search as it runs. The Dancing Links solver
+# only reports its totals, not node or backtrack events
+class SolveStats:
+
+    # The constructor for the SolveStats
+    def __init__(self):
+        self.backtracks = 0 #the number of times the search gave up on a square
+        self.max_depth = 0 #the most values the search has had placed at once
+        self.wipeouts = 0 #the number of domains (or units) left with no possible value
+        self.eliminations = 0 #the domain values removed by forward checking and propagation
+        self.domain_checks = 0 #the consistency checks made on domains (validate and ac3)
+        self.phase_times = {} #the seconds spent in each phase ("parse", "init domains", "search", "output")
+        self.hooks = {} #the callbacks hooked onto each event
+
+    # The hooks are left behind when the stats are sent to another process
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["hooks"] = {}
+        return state
+
+    # Call callback for every later event of the given name
+    def add_hook(self, event, callback):
+        self.hooks.setdefault(event, []).append(callback)
+
+    # Call the callbacks hooked onto event with the given arguments
+    def fire(self, event, *args):
+        for callback in self.hooks.get(event, ()):
+            callback(*args)
+
+    # Add seconds to the time spent in the named phase
+    def add_phase(self, board, name, seconds):
+        self.phase_times[name] = self.phase_times.get(name, 0) + seconds
+        if (self.hooks):
+            self.fire("phase", board, name, seconds)
+
+# The squares, subsquares, neighbors and units of every square on a board of
+# one size. These never change, so get_board_tables builds them once per
+# size and every board of that size shares them
+class BoardTables:
+
+    # The constructor for the BoardTables of a size x size board
+    def __init__(self, size):
+        square_size = int(math.sqrt(size))
+        self.size = size #the size of the board
+        self.squares = tuple((i, j) for i in range(0, size) for j in range(0, size)) #the (row, col) of each index
+        self.boxes = bytes((i // square_size) * square_size + (j // square_size)
+                           for (i, j) in self.squares) #the subsquare of each index
+
+        # The neighbors of each index (row, then column, then subsquare),
+        # as indexes and as (row, col) squares
+        peers = []
+        for (row, col) in self.squares:
+            seen = set([row * size + col])
+            ordered = []
+            r = (row // square_size) * square_size
+            c = (col // square_size) * square_size
+            candidates = []
+            for i in range(0, size):
+                candidates.append(row * size + i)
+                candidates.append(i * size + col)
+            for i in range(0, square_size):
+                for j in range(0, square_size):
+                    candidates.append((r + i) * size + c + j)
+            for p in candidates:
+                if (p not in seen):
+                    seen.add(p)
+                    ordered.append(p)
+            peers.append(tuple(ordered))
+        self.peers = tuple(peers)
+        self.peer_squares = dict((self.squares[i], tuple(self.squares[p] for p in self.peers[i]))
+                                 for i in range(0, len(self.squares)))
+
+        # The rows, columns and subsquares as tuples of squares
+        units = []
+        for i in range(0, size):
+            units.append(tuple((i, j) for j in range(0, size)))
+            units.append(tuple((j, i) for j in range(0, size)))
+        for r in range(0, size, square_size):
+            for c in range(0, size, square_size):
+                units.append(tuple((r + i, c + j) for i in range(0, square_size)
+                                   for j in range(0, square_size)))
+        self.units = tuple(units)
+
+    # Pickle the tables as just their size, so that boards sent to other
+    # processes share the tables already built there
+    def __reduce__(self):
+        return (get_board_tables, (self.size,))
+
+# The BoardTables built so far, by board size
+BOARD_TABLES = {}
+
+# Get the shared BoardTables for boards of the given size
+def get_board_tables(size):
+    if (size not in BOARD_TABLES):
+        BOARD_TABLES[size] = BoardTables(size)
+    return BOARD_TABLES[size]
 
 # This will be the game object your player will manipulate
 class SudokuBoard:
@@ -16,16 +194,106 @@ class SudokuBoard:
         self.BoardSize = size #the size of the board
         self.CurrentGameboard = board #the current state of the game board
         self.SquareSize = int(math.sqrt(self.BoardSize)) #the size of a subsquare on the board
+        self.tables = get_board_tables(self.BoardSize) #the neighbors and units shared by boards of this size
         self.empty_squares = [] #the list of empty squares
         self.possible_values = {} #a dictionary mapping possible values to empty squares
+        self.trail = [] #the (square, value) domain removals made during forward checking
+        self.solutions = [] #the solutions found by count_solutions
+        self.propagation_rules = () #the propagation rules ("ac3", "naked", "hidden") run by propagate
+        self.propagation_counts = {"ac3": 0, "naked": 0, "hidden": 0} #the work done by each propagation rule
+        self.budget = None #the SolveBudget of the current search, or None for each solver's default cap
         self.ConsistencyChecks = 0 #a counter for the total number of consistency checks
+        self.NodesExpanded = 0 #a counter for the number of values placed by the search
+        self.stats = SolveStats() #the backtracks, depth, wipeouts, eliminations and phase times of the search
+        self.search_depth = 0 #the number of values placed by the recursive solvers on the way down
+        self.FullMask = (1 << self.BoardSize) - 1 #a bitmask with one bit set for every value 1..BoardSize
+        self.row_masks = [0] * self.BoardSize #bitmask of the values already placed in each row
+        self.col_masks = [0] * self.BoardSize #bitmask of the values already placed in each column
+        self.box_masks = [0] * self.BoardSize #bitmask of the values already placed in each subsquare
+
+        # Record the initial values of the board in the masks
+        for i in range(0, self.BoardSize):
+            for j in range(0, self.BoardSize):
+                value = self.get_value(i, j)
+                if (value != 0):
+                    bit = 1 << (value - 1)
+                    self.row_masks[i] |= bit
+                    self.col_masks[j] |= bit
+                    self.box_masks[self.get_box(i, j)] |= bit
 
     # This function will create a new sudoku board object with
     # with the input value placed on the GameBoard row and col are
-    # both zero-indexed
+    # both zero-indexed. The row, column and subsquare masks are updated
+    # incrementally, so placing a 0 undoes whatever value was there before
     def set_value(self, row, col, value):
+        box = self.get_box(row, col)
+        old = self.CurrentGameboard[row][col]
+        if (old != 0):
+            bit = ~(1 << (old - 1))
+            self.row_masks[row] &= bit
+            self.col_masks[col] &= bit
+            self.box_masks[box] &= bit
+        if (value != 0):
+            bit = 1 << (value - 1)
+            self.row_masks[row] |= bit
+            self.col_masks[col] |= bit
+            self.box_masks[box] |= bit
         self.CurrentGameboard[row][col] = value #add the value to the appropriate position on the board
    
+    # Use budget (if one is given) for the search that is starting, and start
+    # its clock
+    def use_budget(self, budget):
+        if (budget is not None):
+            self.budget = budget.start()
+
+    # Raise SearchLimitExceeded once the search has run out of its budget. With
+    # no budget, the solver's own default_checks cap on consistency checks applies
+    def check_budget(self, default_checks):
+        if (self.budget is None):
+            if (self.ConsistencyChecks > default_checks):
+                raise SearchLimitExceeded("checks")
+            return
+        reason = self.budget.exceeded(self.ConsistencyChecks, self.NodesExpanded)
+        if (reason is not None):
+            raise SearchLimitExceeded(reason)
+
+    # Count a value placed by the search at depth (the number of values it has
+    # placed on the way down, counting this one)
+    def node_expanded(self, row, col, num, depth):
+        self.NodesExpanded += 1
+        stats = self.stats
+        if (depth > stats.max_depth):
+            stats.max_depth = depth
+        if (stats.hooks):
+            stats.fire("node", self, row, col, num, depth)
+
+    # Count the search giving up on square (row, col) at depth, having tried
+    # every value left for it
+    def backtracked(self, row, col, depth):
+        stats = self.stats
+        stats.backtracks += 1
+        if (stats.hooks):
+            stats.fire("backtrack", self, row, col, depth)
+
+    # Count a domain (or, with square None, a unit) left with no possible value
+    def wiped_out(self, square):
+        stats = self.stats
+        stats.wipeouts += 1
+        if (stats.hooks):
+            stats.fire("wipeout", self, square)
+
+    # Get the search statistics as a dictionary, for JSON result records. The
+    # consistency checks are split into the checks made on domains and the
+    # row, column and subsquare constraint checks
+    def stats_record(self):
+        stats = self.stats
+        return {"nodes": self.NodesExpanded, "backtracks": stats.backtracks,
+                "max_depth": stats.max_depth, "wipeouts": stats.wipeouts,
+                "eliminations": stats.eliminations, "domain_checks": stats.domain_checks,
+                "constraint_checks": self.ConsistencyChecks - stats.domain_checks,
+                "propagation": dict(self.propagation_counts),
+                "phase_times": dict(stats.phase_times)}
+
     # Get the value on the board at position (row, col)
     def get_value(self, row, col):
         return self.CurrentGameboard[row][col]
@@ -39,11 +307,23 @@ class SudokuBoard:
                     empty_squares.append((i, j))
         return empty_squares
 
+    # Get the index of the subsquare containing position (row, col)
+    def get_box(self, row, col):
+        return (row // self.SquareSize) * self.SquareSize + (col // self.SquareSize)
+
+    # Get a bitmask of the values that can still be placed at position (row, col),
+    # where bit (num - 1) is set if num is not used in the row, column or subsquare
+    def get_candidates(self, row, col):
+        used = self.row_masks[row] | self.col_masks[col] | self.box_masks[self.get_box(row, col)]
+        return self.FullMask & ~used
+
     # Get a set of valid values for the square at position (row, col)
     def get_values(self, row, col):
         values = []
+        candidates = self.get_candidates(row, col)
+        self.ConsistencyChecks += self.BoardSize #one check per value, as check_rowcol would count
         for num in range(1, self.BoardSize + 1):
-            if (self.check_rowcol(row, col, num) and self.check_subsquare(row, col, num)):
+            if ((candidates >> (num - 1)) & 1):
                 values.append(num)
         return values
 
@@ -53,77 +333,163 @@ class SudokuBoard:
             pv = self.get_values(es[0], es[1])
             self.possible_values[es] = pv
 
-    # Get the empty squares from the same row and column as the current square
-    def get_rowcol_squares(self, row, col):
-        squares = []
-        for i in range(0, self.BoardSize):
-            if (self.get_value(row, i) == 0):
-                squares.append((row, i))
-            if (self.get_value(i, col) == 0):
-                squares.append((i, col))
-        return squares
-
-    # Get the empty squares from the same square as the current square
-    def get_square_squares(self, row, col):
-        squares = []
-        row = int((row / self.SquareSize)) * self.SquareSize
-        col = int((col / self.SquareSize)) * self.SquareSize
-        row = int(row)
-        col = int(col)
-
-        for i in range(0, self.SquareSize):
-            for j in range(0, self.SquareSize):
-                if (self.get_value((row + i), (col + j)) == 0):
-                    squares.append((row + i, col + j))
-        return squares
-
     # Check the validity of num over row and column (row, col)
     def check_rowcol(self, row, col, num):
         self.ConsistencyChecks += 1
-        for i in range(0, self.BoardSize):
-            if ((self.get_value(row, i) == num) or (self.get_value(i, col) == num)):
-                return False
-        return True
+        return not (((self.row_masks[row] | self.col_masks[col]) >> (num - 1)) & 1)
 
     # Check the validity of num over subsquare s
     def check_subsquare(self, row, col, num):
-        row = int((row / self.SquareSize)) * self.SquareSize
-        col = int((col / self.SquareSize)) * self.SquareSize
-        row = int(row)
-        col = int(col)
-
-        for i in range(0, self.SquareSize):
-            for j in range(0, self.SquareSize):
-                if (self.get_value((row + i), (col + j)) == num):
-                    return False
-        return True
+        return not ((self.box_masks[self.get_box(row, col)] >> (num - 1)) & 1)
 
     # Get the neighboring blank squares to position (row, col)
     def get_neighboring_squares(self, row, col):
-        neighbor_squares = []
-        blanks = self.get_rowcol_squares(row, col) + self.get_square_squares(row, col)
-        for b in blanks:
-            if ((b not in neighbor_squares) and (b != (row, col))):
-                neighbor_squares.append(b)
-        return neighbor_squares
+        board = self.CurrentGameboard
+        return [n for n in self.tables.peer_squares[(row, col)] if board[n[0]][n[1]] == 0]
 
     # Perform forward checking on the neighboring blank squares of position (row, col)
     def validate(self, row, col, num):
-        neighbor_squares = self.get_neighboring_squares(row, col)
-        for n in neighbor_squares:
+        for n in self.get_neighboring_squares(row, col):
             self.ConsistencyChecks += 1
+            self.stats.domain_checks += 1
             valid = self.possible_values[n]
             if (num in valid):
-                self.possible_values[n].remove(num)
-                if (len(self.possible_values[n]) == 0):
+                valid.remove(num)
+                self.trail.append((n, num))
+                self.stats.eliminations += 1
+                if (len(valid) == 0):
+                    self.wiped_out(n)
                     return False
         return True
 
+    # Put back the domain removals recorded on the trail since it had length mark.
+    # Domains are kept in ascending order, so restored values go back in place.
+    # An entry with a value of 0 marks a square filled in by propagate, which is
+    # emptied again
+    def undo_trail(self, mark):
+        while (len(self.trail) > mark):
+            square, num = self.trail.pop()
+            if (num == 0):
+                self.set_value(square[0], square[1], 0)
+            else:
+                bisect.insort(self.possible_values[square], num)
+
+    # Get the rows, columns and subsquares of the board as tuples of squares
+    def get_units(self):
+        return self.tables.units
+
+    # Make every empty square arc consistent with its empty neighbors (AC-3).
+    # Since every constraint is "not equal", a value can only be removed from a
+    # square when a neighbor is down to that single value, so only squares with
+    # one value left ever need to be revisited
+    def ac3(self):
+        queue = deque(es for es in self.empty_squares if self.get_value(es[0], es[1]) == 0)
+        while (queue):
+            square = queue.popleft()
+            domain = self.possible_values[square]
+            if (len(domain) != 1 or self.get_value(square[0], square[1]) != 0):
+                continue
+            num = domain[0]
+            for n in self.get_neighboring_squares(square[0], square[1]):
+                self.ConsistencyChecks += 1
+                self.stats.domain_checks += 1
+                valid = self.possible_values[n]
+                if (num in valid):
+                    valid.remove(num)
+                    self.trail.append((n, num))
+                    self.propagation_counts["ac3"] += 1
+                    self.stats.eliminations += 1
+                    if (len(valid) == 0):
+                        self.wiped_out(n)
+                        return False
+                    if (len(valid) == 1):
+                        queue.append(n)
+        return True
+
+    # Fill in every empty square that has a single possible value left
+    def naked_singles(self):
+        changed = False
+        for es in self.empty_squares:
+            if (self.get_value(es[0], es[1]) == 0 and len(self.possible_values[es]) == 1):
+                self.set_value(es[0], es[1], self.possible_values[es][0])
+                self.trail.append((es, 0))
+                self.propagation_counts["naked"] += 1
+                changed = True
+        return changed
+
+    # Find values that fit in only one empty square of a row, column or
+    # subsquare, and narrow that square's domain down to the value. Returns None
+    # if a value that is still missing from a unit has nowhere to go
+    def hidden_singles(self):
+        changed = False
+        for unit in self.tables.units:
+            # Find the values missing from the unit that fit in exactly one
+            # of its empty squares, using masks of the values seen once and
+            # the values seen more than once
+            placed = 0
+            once = 0
+            more = 0
+            for square in unit:
+                value = self.get_value(square[0], square[1])
+                if (value != 0):
+                    placed |= 1 << (value - 1)
+                    continue
+                for num in self.possible_values[square]:
+                    bit = 1 << (num - 1)
+                    more |= once & bit
+                    once |= bit
+
+            missing = self.FullMask & ~placed
+            if (missing & ~once):
+                self.wiped_out(None)
+                return None
+            singles = missing & once & ~more
+            while (singles):
+                bit = singles & -singles
+                singles ^= bit
+                num = bit.bit_length()
+                square = None
+                for s in unit:
+                    if (self.get_value(s[0], s[1]) == 0 and num in self.possible_values[s]):
+                        square = s
+                        break
+                if (square is None):
+                    # Narrowing another square of this unit took num's only place
+                    self.wiped_out(None)
+                    return None
+                domain = self.possible_values[square]
+                if (len(domain) > 1):
+                    for other in domain:
+                        if (other != num):
+                            self.trail.append((square, other))
+                    self.stats.eliminations += len(domain) - 1
+                    domain[:] = [num]
+                    self.propagation_counts["hidden"] += 1
+                    changed = True
+        return changed
+
+    # Run the enabled propagation rules until none of them makes progress.
+    # All changes go on the trail so a failed search branch can undo them.
+    # Returns False if some square or unit is left without a possible value
+    def propagate(self):
+        changed = True
+        while (changed):
+            changed = False
+            if ("ac3" in self.propagation_rules and not self.ac3()):
+                return False
+            if ("naked" in self.propagation_rules and self.naked_singles()):
+                changed = True
+            if ("hidden" in self.propagation_rules):
+                found = self.hidden_singles()
+                if (found is None):
+                    return False
+                changed = changed or found
+        return True
+
     # Solve the puzzle using backtracking
-    def solve_backtracking(self, row, col):
-        if (self.ConsistencyChecks > 120000000):
-            print ("Consistency checks exceed a reasonable number, terminating program")
-            sys.exit(0)
+    def solve_backtracking(self, row, col, budget = None):
+        self.use_budget(budget)
+        self.check_budget(120000000)
 
         if (col == self.BoardSize):
             row += 1
@@ -134,20 +500,34 @@ class SudokuBoard:
         if (self.get_value(row, col) != 0):
             return self.solve_backtracking(row, col + 1)
 
-        for num in range(1, self.BoardSize + 1):
-            if (self.check_rowcol(row, col, num) and self.check_subsquare(row, col, num)):
-                self.set_value(row, col, num)
-                if (self.solve_backtracking(row, col + 1)):
-                    return True
+        # Walk only the set bits of the candidate mask, but charge one
+        # consistency check for every value up to num, the same as testing
+        # each value in turn with check_rowcol
+        candidates = self.get_candidates(row, col)
+        counted = 0
+        while (candidates):
+            bit = candidates & -candidates
+            candidates ^= bit
+            num = bit.bit_length()
+            self.ConsistencyChecks += num - counted
+            counted = num
+            self.set_value(row, col, num)
+            self.search_depth += 1
+            self.node_expanded(row, col, num, self.search_depth)
+            solved = self.solve_backtracking(row, col + 1)
+            self.search_depth -= 1
+            if (solved):
+                return True
 
+        self.ConsistencyChecks += self.BoardSize - counted
         self.set_value(row, col, 0)
+        self.backtracked(row, col, self.search_depth)
         return False
 
     # Solve the puzzle using forward checking
-    def solve_forwardchecking(self, row, col):
-        if (self.ConsistencyChecks > 5000000):
-            print ("Consistency checks exceed a reasonable number, terminating program")
-            sys.exit(0)
+    def solve_forwardchecking(self, row, col, budget = None):
+        self.use_budget(budget)
+        self.check_budget(5000000)
 
         if (col == self.BoardSize):
             row += 1
@@ -158,91 +538,1135 @@ class SudokuBoard:
         if (self.get_value(row, col) != 0):
             return self.solve_forwardchecking(row, col + 1)
     
-        current_square_index = self.empty_squares.index((row, col))
-        current_square = self.empty_squares[current_square_index]
-        r = current_square[0]
-        c = current_square[1]
-        blanks = copy.deepcopy(self.possible_values[current_square])
+        blanks = list(self.possible_values[(row, col)])
 
         for num in blanks:
-            temp_blanks = copy.deepcopy(self.possible_values)
-            valid = self.validate(r, c, num)
+            mark = len(self.trail)
+            valid = self.validate(row, col, num)
             if (valid):
                 self.set_value(row, col, num)
+                self.search_depth += 1
+                self.node_expanded(row, col, num, self.search_depth)
+                solved = self.propagate() and self.solve_forwardchecking(row, col + 1)
+                self.search_depth -= 1
+                if (solved):
+                    return True
+
+            self.undo_trail(mark)
 
-                if (self.solve_forwardchecking(row, col + 1)):
+        self.set_value(row, col, 0)
+        self.backtracked(row, col, self.search_depth)
+        return False
+
+    # Solve the puzzle using backtracking with an explicit stack instead of
+    # recursion. Only the empty squares are visited, and the search order and
+    # consistency checks are the same as solve_backtracking
+    def solve_backtracking_iterative(self, budget = None):
+        self.use_budget(budget)
+        squares = self.get_empty_squares()
+        stack = [] #for each filled square, [candidates left to try, values counted so far]
+        while (True):
+            self.check_budget(120000000)
+
+            depth = len(stack)
+            if (depth == len(squares)):
+                return True
+            row, col = squares[depth]
+            stack.append([self.get_candidates(row, col), 0])
+
+            # Move to the next candidate, backing up through the stack until
+            # some square still has one left
+            while (stack):
+                frame = stack[-1]
+                row, col = squares[len(stack) - 1]
+                if (frame[0]):
+                    bit = frame[0] & -frame[0]
+                    frame[0] ^= bit
+                    num = bit.bit_length()
+                    self.ConsistencyChecks += num - frame[1]
+                    frame[1] = num
+                    self.set_value(row, col, num)
+                    self.node_expanded(row, col, num, len(stack))
+                    break
+                self.ConsistencyChecks += self.BoardSize - frame[1]
+                self.set_value(row, col, 0)
+                stack.pop()
+                self.backtracked(row, col, len(stack))
+
+            if (not stack):
+                return False
+
+    # Solve the puzzle using forward checking with an explicit stack instead
+    # of recursion. Only the empty squares are visited (skipping any that
+    # propagation filled in), and the search order and consistency checks are
+    # the same as solve_forwardchecking
+    def solve_forwardchecking_iterative(self, budget = None):
+        self.use_budget(budget)
+        squares = self.empty_squares
+        stack = [] #for each filled square, [square, values to try, next value, trail mark, index in squares]
+        index = 0
+        while (True):
+            self.check_budget(5000000)
+
+            while (index < len(squares) and self.get_value(squares[index][0], squares[index][1]) != 0):
+                index += 1
+            if (index == len(squares)):
+                return True
+            square = squares[index]
+            stack.append([square, list(self.possible_values[square]), 0, len(self.trail), index])
+
+            if (not self.next_forwardchecking_value(stack)):
+                return False
+            index = stack[-1][4] + 1
+
+    # Try the next value of the square on top of the stack of an iterative
+    # forward checking search, backing up through the stack until a value
+    # passes forward checking and propagation. Each frame starts with [square,
+    # values to try, next value, trail mark]. Returns False once the stack is
+    # empty, having emptied every square taken off it
+    def next_forwardchecking_value(self, stack):
+        while (stack):
+            frame = stack[-1]
+            row, col = frame[0]
+            self.undo_trail(frame[3])
+            while (frame[2] < len(frame[1])):
+                num = frame[1][frame[2]]
+                frame[2] += 1
+                if (self.validate(row, col, num)):
+                    self.set_value(row, col, num)
+                    self.node_expanded(row, col, num, len(stack))
+                    if (self.propagate()):
+                        return True
+                self.undo_trail(frame[3])
+            self.set_value(row, col, 0)
+            stack.pop()
+            self.backtracked(row, col, len(stack))
+        return False
+
+    # Get the empty square with the fewest possible values left, or None
+    # once every square is filled
+    def fewest_values_square(self):
+        best = None
+        fewest = self.BoardSize + 1
+        for es in self.empty_squares:
+            if (self.get_value(es[0], es[1]) == 0 and len(self.possible_values[es]) < fewest):
+                best = es
+                fewest = len(self.possible_values[es])
+                if (fewest <= 1):
+                    break
+        return best
+
+    # Count the solutions of the puzzle with forward checking (and whatever
+    # propagation_rules are set), always branching on the square with the
+    # fewest values left and carrying on past each solution until limit
+    # solutions have been found, so limit = 2 checks that the solution is
+    # unique. The solutions found are kept in self.solutions, and the board
+    # and its domains are put back the way they were before returning the count
+    def count_solutions(self, limit = 2, budget = None):
+        self.use_budget(budget)
+        self.empty_squares = self.get_empty_squares()
+        self.check_values()
+        self.solutions = []
+        stack = [] #for each filled square, [square, values to try, next value, trail mark]
+        try:
+            if (not self.propagate()):
+                return 0
+
+            while (True):
+                self.check_budget(5000000)
+
+                square = self.fewest_values_square()
+                if (square is None):
+                    self.solutions.append([[self.get_value(i, j) for j in range(0, self.BoardSize)]
+                                           for i in range(0, self.BoardSize)])
+                    if (len(self.solutions) >= limit):
+                        break
+                else:
+                    stack.append([square, list(self.possible_values[square]), 0, len(self.trail)])
+
+                if (not self.next_forwardchecking_value(stack)):
+                    break
+        finally:
+            for frame in stack:
+                self.set_value(frame[0][0], frame[0][1], 0)
+            self.undo_trail(0)
+        return len(self.solutions)
+
+    # Pick the empty square with the fewest possible values left (minimum
+    # remaining values), breaking ties by the number of empty neighboring
+    # squares (the degree heuristic). Returns None once every square is filled
+    def select_square(self):
+        ties = []
+        fewest = self.BoardSize + 1
+        for es in self.empty_squares:
+            if (self.get_value(es[0], es[1]) != 0):
+                continue
+            remaining = len(self.possible_values[es])
+            if (remaining < fewest):
+                fewest = remaining
+                ties = [es]
+            elif (remaining == fewest):
+                ties.append(es)
+
+        if (len(ties) == 0):
+            return None
+        if (len(ties) == 1):
+            return ties[0]
+
+        best = None
+        best_degree = -1
+        for t in ties:
+            degree = len(self.get_neighboring_squares(t[0], t[1]))
+            if (degree > best_degree):
+                best = t
+                best_degree = degree
+        return best
+
+    # Solve the puzzle using forward checking, always expanding the most
+    # constrained empty square next
+    def solve_mrv(self, budget = None):
+        self.use_budget(budget)
+        self.check_budget(5000000)
+
+        square = self.select_square()
+        if (square is None):
+            return True
+        row = square[0]
+        col = square[1]
+        blanks = list(self.possible_values[square])
+
+        for num in blanks:
+            mark = len(self.trail)
+            valid = self.validate(row, col, num)
+            if (valid):
+                self.set_value(row, col, num)
+                self.search_depth += 1
+                self.node_expanded(row, col, num, self.search_depth)
+                solved = self.solve_mrv()
+                self.search_depth -= 1
+                if (solved):
                     return True
 
-            self.possible_values = temp_blanks
+            self.undo_trail(mark)
 
         self.set_value(row, col, 0)
+        self.backtracked(row, col, self.search_depth)
         return False
 
+    # Solve the puzzle as an exact cover problem with Dancing Links. Every
+    # empty square and every value missing from a row, column or subsquare is
+    # a constraint column, and every value that can still go in an empty
+    # square is a matrix row covering four of them
+    def solve_dlx(self, budget = None):
+        self.use_budget(budget)
+        N = self.BoardSize
+        columns = {}
+        for i in range(0, N):
+            for j in range(0, N):
+                if (self.get_value(i, j) == 0):
+                    columns[("cell", i, j)] = len(columns) + 1
+            for num in range(1, N + 1):
+                bit = 1 << (num - 1)
+                if (not self.row_masks[i] & bit):
+                    columns[("row", i, num)] = len(columns) + 1
+                if (not self.col_masks[i] & bit):
+                    columns[("col", i, num)] = len(columns) + 1
+                if (not self.box_masks[i] & bit):
+                    columns[("box", i, num)] = len(columns) + 1
+
+        dlx = DancingLinks(len(columns))
+        dlx.budget = self.budget
+        dlx.base_checks = self.ConsistencyChecks
+        dlx.base_nodes = self.NodesExpanded
+        for i in range(0, N):
+            for j in range(0, N):
+                if (self.get_value(i, j) != 0):
+                    continue
+                for num in self.get_values(i, j):
+                    dlx.add_row((i, j, num), [columns[("cell", i, j)], columns[("row", i, num)],
+                                              columns[("col", j, num)],
+                                              columns[("box", self.get_box(i, j), num)]])
+
+        try:
+            solved = dlx.search()
+        finally:
+            self.ConsistencyChecks += dlx.checks
+            self.NodesExpanded += dlx.nodes
+            self.stats.backtracks += dlx.backtracks
+            self.stats.max_depth = max(self.stats.max_depth, dlx.max_depth)
+        if (solved):
+            for (i, j, num) in dlx.solution:
+                self.set_value(i, j, num)
+        return solved
+
     # Print out the puzzle
     def write_grid(self):
+        start = time.time()
         for i in range(0, self.BoardSize):
             for j in range(0, self.BoardSize):
                 print(self.get_value(i, j), end=" ")
             print()
         print()
+        self.stats.add_phase(self, "output", time.time() - start)
         return
 
+# A SudokuBoard backed by a flat bytearray of BoardSize * BoardSize cells
+# instead of a list of row lists, using the index tables in BoardTables for
+# the subsquare and neighbors of every cell. Square (row, col) is stored at
+# index row * BoardSize + col. Boards up to 255 x 255 fit in a byte per cell
+class FlatSudokuBoard(SudokuBoard):
+
+    # The constructor for the FlatSudokuBoard, taking the same arguments as
+    # SudokuBoard
+    def __init__(self, size, board):
+        tables = get_board_tables(size)
+        self.squares = tables.squares #the (row, col) of each index
+        self.boxes = tables.boxes #the subsquare of each index
+        self.peers = tables.peers #the neighbors of each index
+        SudokuBoard.__init__(self, size, board)
+
+    # The board as a list of row lists. Reading it returns a copy, so
+    # squares must be changed with set_value
+    @property
+    def CurrentGameboard(self):
+        N = self.BoardSize
+        return [list(self.cells[i * N:(i + 1) * N]) for i in range(0, N)]
+
+    @CurrentGameboard.setter
+    def CurrentGameboard(self, board):
+        self.cells = bytearray(value for row in board for value in row) #the value in each square
+
+    # Place value at position (row, col), updating the masks as
+    # SudokuBoard.set_value does
+    def set_value(self, row, col, value):
+        index = row * self.BoardSize + col
+        box = self.boxes[index]
+        old = self.cells[index]
+        if (old != 0):
+            bit = ~(1 << (old - 1))
+            self.row_masks[row] &= bit
+            self.col_masks[col] &= bit
+            self.box_masks[box] &= bit
+        if (value != 0):
+            bit = 1 << (value - 1)
+            self.row_masks[row] |= bit
+            self.col_masks[col] |= bit
+            self.box_masks[box] |= bit
+        self.cells[index] = value
+
+    # Get the value on the board at position (row, col)
+    def get_value(self, row, col):
+        return self.cells[row * self.BoardSize + col]
+
+    # Get the squares on the board that are empty at initialization
+    def get_empty_squares(self):
+        cells = self.cells
+        return [self.squares[i] for i in range(0, len(cells)) if cells[i] == 0]
+
+    # Get the index of the subsquare containing position (row, col)
+    def get_box(self, row, col):
+        return self.boxes[row * self.BoardSize + col]
+
+    # Get the neighboring blank squares to position (row, col)
+    def get_neighboring_squares(self, row, col):
+        cells = self.cells
+        squares = self.squares
+        return [squares[p] for p in self.peers[row * self.BoardSize + col] if cells[p] == 0]
+
+# Exact cover solver using Knuth's Dancing Links (Algorithm X). The links
+# are kept in flat lists indexed by node: node 0 is the root header, nodes
+# 1..columns are the column headers and every later node is a 1 in the matrix
+class DancingLinks:
+
+    # The constructor for an empty matrix with the given number of columns
+    def __init__(self, columns):
+        self.L = [columns] + list(range(0, columns)) #the node to the left
+        self.R = list(range(1, columns + 1)) + [0] #the node to the right
+        self.U = list(range(0, columns + 1)) #the node above
+        self.D = list(range(0, columns + 1)) #the node below
+        self.C = list(range(0, columns + 1)) #the column header of each node
+        self.S = [0] * (columns + 1) #the number of nodes left in each column
+        self.row_ids = [None] * (columns + 1) #the caller's id for the row of each node
+        self.solution = [] #the row ids of the rows chosen so far
+        self.checks = 0 #the number of node unlinks performed while covering
+        self.nodes = 0 #the number of rows tried by the search
+        self.backtracks = 0 #the number of columns the search ran out of rows for
+        self.max_depth = 0 #the most rows chosen at once
+        self.budget = None #the SolveBudget of the search, or None for no limits
+        self.base_checks = 0 #the checks already charged to the budget before the search
+        self.base_nodes = 0 #the nodes already charged to the budget before the search
+
+    # Append a row with 1s in the given columns (numbered from 1)
+    def add_row(self, row_id, row_columns):
+        first = None
+        for col in row_columns:
+            x = len(self.C)
+            self.C.append(col)
+            self.row_ids.append(row_id)
+            self.U.append(self.U[col])
+            self.D.append(col)
+            self.D[self.U[col]] = x
+            self.U[col] = x
+            self.S[col] += 1
+            if (first is None):
+                first = x
+                self.L.append(x)
+                self.R.append(x)
+            else:
+                self.L.append(self.L[first])
+                self.R.append(first)
+                self.R[self.L[first]] = x
+                self.L[first] = x
+
+    # Remove column c from the header list and every row that has a 1 in c
+    # from the other columns
+    def cover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while (i != c):
+            j = R[i]
+            while (j != i):
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                self.checks += 1
+                j = R[j]
+            i = D[i]
+
+    # Undo cover(c), relinking in the reverse order
+    def uncover(self, c):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while (i != c):
+            j = L[i]
+            while (j != i):
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    # Search for a set of rows covering every column exactly once, always
+    # branching on the column with the fewest rows left. The chosen rows are
+    # left in self.solution
+    def search(self):
+        R, D, S = self.R, self.D, self.S
+        if (R[0] == 0):
+            return True
+        if (self.budget is not None):
+            reason = self.budget.exceeded(self.base_checks + self.checks, self.base_nodes + self.nodes)
+            if (reason is not None):
+                raise SearchLimitExceeded(reason)
+
+        c = R[0]
+        j = R[c]
+        while (j != 0):
+            if (S[j] < S[c]):
+                c = j
+            j = R[j]
+        if (S[c] == 0):
+            return False
+
+        self.cover(c)
+        r = D[c]
+        while (r != c):
+            self.solution.append(self.row_ids[r])
+            self.nodes += 1
+            if (len(self.solution) > self.max_depth):
+                self.max_depth = len(self.solution)
+            j = R[r]
+            while (j != r):
+                self.cover(self.C[j])
+                j = R[j]
+
+            if (self.search()):
+                return True
+
+            self.solution.pop()
+            j = self.L[r]
+            while (j != r):
+                self.uncover(self.C[j])
+                j = self.L[j]
+            r = D[r]
+        self.uncover(c)
+        self.backtracks += 1
+        return False
+
+# Get the value of one square in the compact puzzle format: "." or "0" for
+# an empty square, "1" to "9", then "A" (10) to "P" (25) for larger boards
+def compact_value(ch):
+    if (ch == "."):
+        return 0
+    if (ch.isdigit()):
+        return int(ch)
+    if (ch.isalpha()):
+        return ord(ch.upper()) - ord("A") + 10
+    raise ValueError("Invalid square in compact puzzle: " + ch)
+
+# read_boards
+#this generator reads sudoku puzzles one at a time from a stream of lines,
+#yielding each one as a 2d array [row,col] like parse_file. A stream can hold
+#any number of puzzles, each in either format:
+# - the course website format: the BoardSize, the number of values, then one
+#   "row col val" line (1-indexed) per value
+# - the compact format: a whole puzzle on one line, either as BoardSize^2
+#   characters (see compact_value) or as BoardSize^2 whitespace separated numbers
+# blank lines and lines starting with "#" are skipped
+# A puzzle that can't be read raises ValueError or IndexError, unless
+# report_errors is set: then its error message is yielded in its place and
+# reading carries on with the next puzzle, skipping any "row col val" lines
+# left over from the bad one
+def read_boards(stream, report_errors = False):
+    lines = iter(stream)
+    pending = None #a line to read again as the start of the next puzzle
+    skip_values = False #whether to skip the value lines of a puzzle that couldn't be read
+    while (True):
+        if (pending is not None):
+            line = pending
+            pending = None
+        else:
+            line = next(lines, None)
+            if (line is None):
+                return
+        tokens = line.split()
+        if (len(tokens) == 0 or tokens[0].startswith("#")):
+            continue
+        if (skip_values and len(tokens) == 3):
+            continue
+        skip_values = False
+
+        try:
+            if (len(tokens) == 1 and len(tokens[0]) <= 3):
+                BoardSize = int(tokens[0])
+                line = next(lines, "")
+                try:
+                    NumVals = int(line.strip())
+                except ValueError:
+                    #a line of several numbers may be a value line or start the next puzzle
+                    if (len(line.split()) != 1):
+                        pending = line
+                    skip_values = True
+                    raise
+
+                #initialize a blank board
+                board = [ [ 0 for i in range(BoardSize) ] for j in range(BoardSize) ]
+
+                #populate the board with initial values
+                for i in range(NumVals):
+                    line = next(lines, "")
+                    linearr = line.strip().split()
+                    if (len(linearr) < 3):
+                        #the puzzle is cut short, so this line may start the next one
+                        pending = line or None
+                        raise ValueError("Puzzle ends before all of its values are read")
+                    skip_values = True
+                    row = int(linearr[0])
+                    col = int(linearr[1])
+                    val = int(linearr[2])
+                    board[row-1][col-1] = val
+                skip_values = False
+            else:
+                if (len(tokens) == 1):
+                    values = [compact_value(ch) for ch in tokens[0]]
+                else:
+                    values = [int(t) for t in tokens]
+                BoardSize = int(round(math.sqrt(len(values))))
+                SquareSize = int(round(math.sqrt(BoardSize)))
+                if (BoardSize * BoardSize != len(values) or SquareSize * SquareSize != BoardSize):
+                    raise ValueError("Compact puzzle has %d squares, which is not a sudoku board" % len(values))
+                board = [values[i * BoardSize:(i + 1) * BoardSize] for i in range(BoardSize)]
+        except (ValueError, IndexError) as e:
+            if (not report_errors):
+                raise
+            yield str(e)
+            continue
+        yield board
+
+# Open a puzzle file for reading, or use stdin if the name is "-"
+def open_puzzles(filename):
+    if (filename == "-"):
+        return sys.stdin
+    return open(filename, 'r')
+
+# Lazily yield a SudokuBoard (or a FlatSudokuBoard if flat is set) for every
+# puzzle in a file, or in stdin if the name is "-"
+def read_puzzles(filename, flat = False):
+    f = open_puzzles(filename)
+    try:
+        for board in read_boards(f):
+            if (flat):
+                yield FlatSudokuBoard(len(board), board)
+            else:
+                yield SudokuBoard(len(board), board)
+    finally:
+        if (f is not sys.stdin):
+            f.close()
+
 # parse_file
 #this function will parse a sudoku text file (like those posted on the website)
 #into a BoardSize, and a 2d array [row,col] which holds the value of each cell.
 # array elements with a value of 0 are considered to be empty
+# If the file holds several puzzles, only the first is returned
 def parse_file(filename):
-    f = open(filename, 'r')
-    BoardSize = int(f.readline())
-    NumVals = int(f.readline())
-
-    #initialize a blank board
-    board = [ [ 0 for i in range(BoardSize) ] for j in range(BoardSize) ]
-
-    #populate the board with initial values
-    for i in range(NumVals):
-        linearr = f.readline().strip().split()
-        row = int(linearr[0])
-        col = int(linearr[1])
-        val = int(linearr[2])
-        board[row-1][col-1] = val
-    return board
-    
+    f = open_puzzles(filename)
+    try:
+        for board in read_boards(f):
+            return board
+    finally:
+        if (f is not sys.stdin):
+            f.close()
+    raise ValueError("No puzzle found in " + filename)
+
 # creates a SudokuBoard object initialized with values from a text file like those found on the course website
-def init_board(file_name):
+# If flat is set the board is a FlatSudokuBoard. The time taken is recorded as
+# the board's "parse" phase
+def init_board(file_name, flat = False):
+    start = time.time()
     board = parse_file(file_name)
-    return SudokuBoard(len(board), board)
+    if (flat):
+        sb = FlatSudokuBoard(len(board), board)
+    else:
+        sb = SudokuBoard(len(board), board)
+    sb.stats.add_phase(sb, "parse", time.time() - start)
+    return sb
+
+# The solve options accepted by solve_board and main
+SOLVE_MODES = ("b", "f", "m", "p", "d")
+
+# Run the solver selected by mode on the board within budget (None for the
+# solver's default cap), returning True if it was solved and raising
+# SearchLimitExceeded if the budget runs out. Use "b" for backtracking, "f" for forward checking, "m" for forward
+# checking with most-constrained (MRV/degree) square ordering, "p" for
+# forward checking with AC-3, naked single and hidden single propagation
+# and "d" for the Dancing Links exact cover solver. Setting up the domains is
+# recorded as the board's "init domains" phase, and the rest as "search"
+def solve_board(sb, mode, budget = None):
+    if (mode not in SOLVE_MODES):
+        raise ValueError("Unknown solve mode: " + str(mode))
+    if (mode in ("f", "m", "p")):
+        start = time.time()
+        sb.empty_squares = sb.get_empty_squares()
+        sb.check_values()
+        sb.stats.add_phase(sb, "init domains", time.time() - start)
+
+    start = time.time()
+    try:
+        if (mode == "b"):
+            return sb.solve_backtracking_iterative(budget)
+        elif (mode == "f"):
+            return sb.solve_forwardchecking_iterative(budget)
+        elif (mode == "m"):
+            return sb.solve_mrv(budget)
+        elif (mode == "p"):
+            sb.propagation_rules = ("ac3", "naked", "hidden")
+            sb.use_budget(budget)
+            return sb.propagate() and sb.solve_forwardchecking_iterative()
+        else:
+            return sb.solve_dlx(budget)
+    finally:
+        sb.stats.add_phase(sb, "search", time.time() - start)
+
+# Run the solver selected by mode on the board within budget, as solve_board
+# does, but return a SolveResult instead of raising when the budget runs out
+def solve_within_budget(sb, mode, budget = None):
+    start = time.time()
+    reason = None
+    try:
+        solved = bool(solve_board(sb, mode, budget))
+        status = "solved" if solved else "no solution"
+    except SearchLimitExceeded as e:
+        solved = False
+        status = "budget exceeded"
+        reason = str(e)
+    return SolveResult(solved, status, reason, sb.ConsistencyChecks, sb.NodesExpanded,
+                       time.time() - start, sb.stats_record())
+
+# Worker for solve_portfolio: solve the board with one strategy within budget
+# and put (mode, solved, solved board or None, consistency checks, nodes
+# expanded, stats) on the results queue
+def race_strategy(sb, mode, results, budget):
+    solved = False
+    try:
+        solved = solve_board(sb, mode, budget)
+    except SearchLimitExceeded:
+        pass
+    finally:
+        results.put((mode, solved, sb.CurrentGameboard if solved else None, sb.ConsistencyChecks,
+                     sb.NodesExpanded, sb.stats))
+
+# Race several solve strategies on the same board, each in its own process.
+# The first solution found is copied into sb (along with the winner's
+# consistency checks, nodes expanded and stats) and the other processes are terminated. Every strategy
+# gets its own copy of budget, all on the same clock. Returns the winning
+# mode, or None if no strategy solved the board
+def solve_portfolio(sb, modes = SOLVE_MODES, budget = None):
+    if (budget is not None):
+        budget.start()
+    results = multiprocessing.Queue()
+    processes = []
+    for mode in modes:
+        p = multiprocessing.Process(target = race_strategy, args = (sb, mode, results, budget))
+        p.daemon = True
+        p.start()
+        processes.append(p)
+
+    winner = None
+    try:
+        for i in range(len(processes)):
+            mode, solved, board, checks, nodes, stats = results.get()
+            if (solved):
+                winner = mode
+                for row in range(0, sb.BoardSize):
+                    for col in range(0, sb.BoardSize):
+                        sb.set_value(row, col, board[row][col])
+                sb.ConsistencyChecks = checks
+                sb.NodesExpanded = nodes
+                stats.hooks = sb.stats.hooks
+                sb.stats = stats
+                break
+    finally:
+        for p in processes:
+            if (p.is_alive()):
+                p.terminate()
+            p.join()
+    return winner
+
+# Solve one puzzle for solve_batch within a fresh copy of budget (None for
+# the solver's default cap). The job holds the file name and position of the
+# puzzle, its board (or the error message if it couldn't be read), the mode
+# and the budget. Returns a result record instead of raising, so one bad
+# puzzle can't stop the batch
+def solve_puzzle(job):
+    file_name, index, board, mode, budget = job
+    record = {"file": file_name, "puzzle": index, "mode": mode}
+    if (isinstance(board, str)):
+        record.update(SolveResult(False, "unreadable: " + board, None, 0, 0, 0).as_record())
+    else:
+        sb = SudokuBoard(len(board), board)
+        if (budget is not None):
+            budget = budget.fresh()
+        record.update(solve_within_budget(sb, mode, budget).as_record())
+    return record
+
+# Solve the first puzzle in a file, as solve_puzzle does. The job holds the
+# file name, the mode and the budget
+def solve_file(job):
+    file_name, mode, budget = job
+    try:
+        board = parse_file(file_name)
+    except (IOError, ValueError, IndexError) as e:
+        board = str(e)
+    return solve_puzzle((file_name, 0, board, mode, budget))
+
+# Lazily yield a solve_puzzle job for every puzzle in the given files ("-"
+# for stdin), numbering the puzzles within each file from 0. A puzzle that
+# can't be read gets a job holding its error message, and the rest of the
+# file is still read
+def batch_jobs(files, mode, budget):
+    for file_name in files:
+        index = 0
+        try:
+            f = open_puzzles(file_name)
+            try:
+                for board in read_boards(f, True):
+                    yield (file_name, index, board, mode, budget)
+                    index += 1
+            finally:
+                if (f is not sys.stdin):
+                    f.close()
+        except (IOError, ValueError, IndexError) as e:
+            yield (file_name, index, str(e), mode, budget)
+
+# Solve every puzzle in a directory (all of its .sudoku files), in the files
+# matching a glob pattern, or in stdin if the pattern is "-", across a pool of
+# worker processes. Each file may hold any number of puzzles (see
+# read_boards), which are read lazily as the workers need them, and each
+# puzzle gets its own copy of budget. One JSON result record per puzzle is
+# written to output as each one finishes. Returns the records
+def solve_batch(pattern, mode, budget = None, processes = None, output = None):
+    if (pattern == "-"):
+        files = ["-"]
+    elif (os.path.isdir(pattern)):
+        files = sorted(glob.glob(os.path.join(pattern, "*.sudoku")))
+    else:
+        files = sorted(glob.glob(pattern))
+
+    records = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for record in pool.imap_unordered(solve_puzzle, batch_jobs(files, mode, budget)):
+            if (output is not None):
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+            records.append(record)
+    finally:
+        pool.close()
+        pool.join()
+    return records
+
+# Write a board to stream in the course website format, preceded by any
+# comment lines (which read_boards skips)
+def write_puzzle(board, stream, comments = ()):
+    for c in comments:
+        stream.write("# " + c + "\n")
+    values = [(i + 1, j + 1, board[i][j]) for i in range(len(board))
+              for j in range(len(board)) if board[i][j] != 0]
+    stream.write("%d\n%d\n" % (len(board), len(values)))
+    for v in values:
+        stream.write("%d %d %d\n" % v)
+
+# Build a random complete size x size grid: the subsquares on the diagonal
+# don't constrain each other, so they are filled with shuffled values and the
+# Dancing Links solver fills in the rest
+def random_solution(size, rng):
+    square_size = int(math.sqrt(size))
+    board = [ [ 0 for i in range(size) ] for j in range(size) ]
+    for b in range(0, size, square_size):
+        values = list(range(1, size + 1))
+        rng.shuffle(values)
+        for i in range(0, square_size):
+            for j in range(0, square_size):
+                board[b + i][b + j] = values[i * square_size + j]
+    sb = SudokuBoard(size, board)
+    sb.solve_dlx()
+    return sb.CurrentGameboard
+
+# The grades given by grade_puzzle below "expert", easiest first, each with
+# the most nodes expanded per empty square and the most consistency checks
+# per empty square and value it allows. Setting up the domains and
+# propagating costs about 2 checks per square and value, so a puzzle over the
+# checks limit has made propagation work hard even if it needed few guesses
+GRADE_LIMITS = (("easy", 0, 4), ("medium", 0.1, 4), ("hard", 1, 25))
+
+# Grade a puzzle by how hard forward checking with propagation has to work
+# for it: "easy" if propagation alone solves it, then "medium", "hard" or
+# "expert" as the nodes expanded and the consistency checks per empty square
+# grow (see GRADE_LIMITS). Returns the grade, the consistency checks and the
+# nodes expanded, with a grade of "unsolved" if the search runs out of budget
+# (None for the default cap)
+def grade_puzzle(board, budget = None):
+    sb = SudokuBoard(len(board), [row[:] for row in board])
+    empties = max(len(sb.get_empty_squares()), 1)
+    try:
+        solve_board(sb, "p", budget)
+    except SearchLimitExceeded:
+        return ("unsolved", sb.ConsistencyChecks, sb.NodesExpanded)
+    nodes = float(sb.NodesExpanded) / empties
+    checks = float(sb.ConsistencyChecks) / (empties * sb.BoardSize)
+    grade = "expert"
+    for (name, max_nodes, max_checks) in GRADE_LIMITS:
+        if (nodes <= max_nodes and checks <= max_checks):
+            grade = name
+            break
+    return (grade, sb.ConsistencyChecks, sb.NodesExpanded)
+
+# Generate a puzzle with a unique solution from a random complete grid by
+# taking clues away in random order, keeping every clue whose removal
+# leaves more than one solution (or whose uniqueness check runs out of a
+# fresh copy of the budget). The job holds the board size, the random seed
+# and the budget, so a corpus can be regenerated exactly. Returns
+# (board, grade, checks, nodes)
+def generate_puzzle(job):
+    size, seed, budget = job
+    rng = random.Random(seed)
+    board = random_solution(size, rng)
+    sb = SudokuBoard(size, board)
+    sb.propagation_rules = ("ac3", "naked", "hidden")
+
+    squares = [(i, j) for i in range(0, size) for j in range(0, size)]
+    rng.shuffle(squares)
+    for (i, j) in squares:
+        value = sb.get_value(i, j)
+        sb.set_value(i, j, 0)
+        sb.ConsistencyChecks = 0
+        sb.NodesExpanded = 0
+        try:
+            unique = sb.count_solutions(2, budget.fresh()) == 1
+        except SearchLimitExceeded:
+            unique = False
+        if (not unique):
+            sb.set_value(i, j, value)
+
+    puzzle = sb.CurrentGameboard
+    grade, checks, nodes = grade_puzzle(puzzle)
+    return (puzzle, grade, checks, nodes)
+
+# Generate count puzzles of the given size across a pool of worker processes
+# and write them all to one file (see read_boards), each preceded by a
+# comment with its seed, grade, consistency checks and nodes expanded.
+# Every uniqueness check gets its own copy of budget (by default 200000
+# consistency checks). Returns the number of puzzles of each grade
+def generate_corpus(size, count, output_file, processes = None, seed = 0, budget = None):
+    if (budget is None):
+        budget = SolveBudget(200000)
+    grades = {}
+    jobs = [(size, seed + n, budget) for n in range(count)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        with open(output_file, "w") as f:
+            for (n, result) in enumerate(pool.imap(generate_puzzle, jobs)):
+                puzzle, grade, checks, nodes = result
+                grades[grade] = grades.get(grade, 0) + 1
+                write_puzzle(puzzle, f, ["seed %d grade %s checks %d nodes %d" % (seed + n, grade, checks, nodes)])
+    finally:
+        pool.close()
+        pool.join()
+    return grades
+
+# The puzzle directories bundled next to this file that run_benchmark solves
+BENCHMARK_SETS = ("4x4", "9x9", "16x16", "25x25")
+
+# Solve a single puzzle file for run_benchmark. The timed solve comes from
+# solve_file, then the same search is repeated under tracemalloc to get the
+# peak memory in bytes, so the tracing overhead doesn't skew the wall time
+def benchmark_file(job):
+    record = solve_file(job)
+    file_name, mode, budget = job
+    tracemalloc.start()
+    try:
+        sb = init_board(file_name)
+        solve_within_budget(sb, mode, budget.fresh() if budget is not None else None)
+        record["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    except (IOError, ValueError, IndexError):
+        record["peak_memory"] = 0
+    finally:
+        tracemalloc.stop()
+    return record
+
+# Solve every bundled puzzle with each of the given solve modes in a process
+# pool and return the results keyed by "<file> <mode>". Every puzzle gets its
+# own copy of budget (by default 60 seconds and each solver's default check
+# cap). If output is given, the results are saved there as a JSON baseline
+def run_benchmark(modes = SOLVE_MODES, budget = None, processes = None, output = None):
+    if (budget is None):
+        budget = SolveBudget(seconds = 60)
+    here = os.path.dirname(os.path.abspath(__file__))
+    jobs = []
+    for puzzle_set in BENCHMARK_SETS:
+        for f in sorted(glob.glob(os.path.join(here, puzzle_set, "*.sudoku"))):
+            for mode in modes:
+                jobs.append((f, mode, budget))
+
+    results = {}
+    pool = multiprocessing.Pool(processes)
+    try:
+        for record in pool.imap_unordered(benchmark_file, jobs):
+            record["file"] = os.path.relpath(record["file"], here)
+            results[record["file"] + " " + record["mode"]] = record
+    finally:
+        pool.close()
+        pool.join()
+
+    if (output is not None):
+        with open(output, "w") as f:
+            json.dump({"max_checks": budget.max_checks, "max_nodes": budget.max_nodes,
+                       "seconds": budget.seconds, "results": results},
+                      f, indent = 1, sort_keys = True)
+    return results
+
+# Compare two saved benchmark runs and return a description of every
+# regression: a puzzle the baseline solved that is no longer solved, or a
+# checks, nodes, wall time or peak memory figure that grew by more than
+# threshold (a fraction of the baseline). Wall times under min_seconds are
+# too noisy to compare and are skipped
+def compare_benchmarks(baseline_file, current_file, threshold = 0.1, min_seconds = 0.05):
+    with open(baseline_file) as f:
+        baseline = json.load(f)["results"]
+    with open(current_file) as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    for key in sorted(baseline):
+        old = baseline[key]
+        if (key not in current):
+            regressions.append(key + ": missing from the current run")
+            continue
+        new = current[key]
+        if (old["solved"] and not new["solved"]):
+            regressions.append(key + ": no longer solved (" + new["status"] + ")")
+            continue
+        for metric in ("checks", "nodes", "seconds", "peak_memory"):
+            if (metric == "seconds" and old[metric] < min_seconds):
+                continue
+            if (new.get(metric, 0) > old.get(metric, 0) * (1 + threshold)):
+                regressions.append("%s: %s went from %s to %s" % (key, metric, old.get(metric), new.get(metric)))
+    return regressions
 
 # Main method accepts a filename and option as input, and runs the appropriate
 # solve method based on the option. Exceptions are thrown for invalid filenames
 # and invalid argument counts. The board is also printed before and after it is
 # solved, along with the total number of consistency checks
-# Use "b" for backtracking and "f" for forward checking
+# See solve_board for the options
 # (ex. `python3.2 Sudoku.py 4x4.sudoku b`)
+# Add "flat" after the option to use the flat array FlatSudokuBoard
+# Use "r" to race every solve option in parallel and report the winner
+# Use "-" as the filename to read the puzzle from stdin
+# With "batch" in place of the filename, every puzzle in a directory, glob or
+# stdin ("-") is solved in a process pool and a JSON result record is printed
+# for each one. Files may hold many puzzles (see read_boards). The optional
+# max checks, seconds and max nodes are the SolveBudget given to each puzzle
+# (ex. `python3 Sudoku.py batch "16x16/*.sudoku" p 5000000 60`)
+# "count <filename> [limit]" counts the solutions of a puzzle, stopping at
+# limit (default 2, which tells whether the solution is unique)
+# "generate <size> <count> <output file> [processes] [seed]" writes count new
+# puzzles with unique solutions and their difficulty grades to one file
+# "benchmark <output.json> [modes] [seconds]" solves every bundled puzzle with
+# each mode and saves the results, and "compare <baseline.json> <current.json>
+# [threshold]" prints the regressions between two saved runs, returning 1 if
+# there are any
+# (ex. `python3 Sudoku.py benchmark baseline.json fpd 30`)
 def main(argv = None):
-    runtime = time.clock()
+    runtime = time.time()
     if argv is None:
         argv = sys.argv
 
-    if (len(argv) != 3):
+    if (len(argv) >= 2 and argv[1] == "benchmark"):
+        if (len(argv) < 3 or len(argv) > 5):
+            print("Wrong number of arguments")
+            return
+        modes = argv[3] if len(argv) > 3 else "".join(SOLVE_MODES)
+        if (any(mode not in SOLVE_MODES for mode in modes)):
+            print("Invalid solve option")
+            return
+        try:
+            seconds = float(argv[4]) if len(argv) > 4 else 60
+        except ValueError:
+            print("Invalid time limit")
+            return
+        results = run_benchmark(tuple(modes), SolveBudget(seconds = seconds), None, argv[2])
+        solved = len([r for r in results.values() if r["solved"]])
+        print ("Solved", solved, "of", len(results), "puzzle runs, results saved to", argv[2])
+        return
+
+    if (len(argv) >= 2 and argv[1] == "count"):
+        if (len(argv) < 3 or len(argv) > 4):
+            print("Wrong number of arguments")
+            return
+        try:
+            limit = int(argv[3]) if len(argv) > 3 else 2
+            sb = init_board(argv[2])
+        except ValueError:
+            print("Invalid puzzle or limit")
+            return
+        except IOError:
+            print("No input file!")
+            return
+        sb.propagation_rules = ("ac3", "naked", "hidden")
+        try:
+            count = sb.count_solutions(limit)
+        except SearchLimitExceeded as e:
+            print ("Search budget exceeded (" + str(e) + "), terminating program")
+            return
+        if (count >= limit):
+            print ("At least", count, "solutions found")
+        else:
+            print (count, "solutions found")
+        print ("Total number of consistency checks:", sb.ConsistencyChecks)
+        print ("Total number of nodes expanded:", sb.NodesExpanded)
+        print ("Counted in:", time.time() - runtime, "seconds")
+        return
+
+    if (len(argv) >= 2 and argv[1] == "generate"):
+        if (len(argv) < 5 or len(argv) > 7):
+            print("Wrong number of arguments")
+            return
+        try:
+            size = int(argv[2])
+            count = int(argv[3])
+            processes = int(argv[5]) if len(argv) > 5 else None
+            seed = int(argv[6]) if len(argv) > 6 else 0
+        except ValueError:
+            print("Invalid generate arguments")
+            return
+        if (size not in (4, 9, 16, 25)):
+            print("Board size must be 4, 9, 16 or 25")
+            return
+        grades = generate_corpus(size, count, argv[4], processes, seed)
+        print ("Generated", count, "puzzles:", ", ".join("%d %s" % (grades[g], g) for g in sorted(grades)))
+        print ("Generated in:", time.time() - runtime, "seconds")
+        return
+
+    if (len(argv) >= 2 and argv[1] == "compare"):
+        if (len(argv) < 4 or len(argv) > 5):
+            print("Wrong number of arguments")
+            return
+        try:
+            threshold = float(argv[4]) if len(argv) > 4 else 0.1
+            regressions = compare_benchmarks(argv[2], argv[3], threshold)
+        except (IOError, ValueError, KeyError) as e:
+            print("Could not compare benchmark files:", e)
+            return 1
+        for r in regressions:
+            print ("Regression:", r)
+        print (len(regressions), "regressions found")
+        return 1 if regressions else 0
+
+    if (len(argv) >= 2 and argv[1] == "batch"):
+        if (len(argv) < 4 or len(argv) > 8):
+            print("Wrong number of arguments")
+            return
+        try:
+            limits = [None, None, None, None]
+            for i, arg in enumerate(argv[4:]):
+                limits[i] = float(arg) if i == 1 else int(arg)
+        except ValueError:
+            print("Invalid batch limits")
+            return
+        if (argv[3] not in SOLVE_MODES):
+            print("Invalid solve option")
+            return
+        budget = None
+        if (limits[0] is not None or limits[1] is not None or limits[3] is not None):
+            budget = SolveBudget(limits[0], limits[3], limits[1])
+        solve_batch(argv[2], argv[3], budget, limits[2], sys.stdout)
+        return
+
+    if (len(argv) != 3 and (len(argv) != 4 or argv[3] != "flat")):
         print("Wrong number of arguments")
         return
+    if (argv[2] not in SOLVE_MODES and argv[2] != "r"):
+        print("Invalid solve option")
+        return
 
     try:
-        sb = init_board(argv[1]) #initialize the board from input
+        sb = init_board(argv[1], len(argv) == 4) #initialize the board from input
 
-        # Solve the board using backtracking or forward checking
-        if (argv[2] == "b"):
-            sb.solve_backtracking(0, 0)
-        elif (argv[2] == "f"):
-            sb.empty_squares = sb.get_empty_squares()
-            sb.check_values()
-            sb.solve_forwardchecking(0, 0)
+        # Solve the board with the selected solver
+        if (argv[2] == "r"):
+            winner = solve_portfolio(sb)
+            print ("Portfolio winner:", winner)
+            solved = winner is not None
+        else:
+            result = solve_within_budget(sb, argv[2])
+            if (result.status == "budget exceeded"):
+                print ("Search budget exceeded (" + result.reason + "), terminating program")
+                return
+            solved = result.solved
+        if (not solved):
+            print ("No solution, terminating program")
+            return
 
         sb.write_grid() #display the board results
         #display the total number of consistency checks
         print ("Total number of consistency checks:", sb.ConsistencyChecks)
-        runtime = time.clock() - runtime
+        if (sb.propagation_rules):
+            print ("Propagation (ac3 removals, naked singles, hidden singles):",
+                   sb.propagation_counts["ac3"], sb.propagation_counts["naked"],
+                   sb.propagation_counts["hidden"])
+        #display the search statistics and the time taken by each phase
+        stats = sb.stats
+        print ("Nodes expanded:", sb.NodesExpanded, "backtracks:", stats.backtracks,
+               "max depth:", stats.max_depth, "wipeouts:", stats.wipeouts,
+               "eliminations:", stats.eliminations)
+        print ("Checks (domain, constraint):", stats.domain_checks,
+               sb.ConsistencyChecks - stats.domain_checks)
+        print ("Phase times:", ", ".join("%s %.6f" % (name, seconds)
+                                         for name, seconds in stats.phase_times.items()))
+        runtime = time.time() - runtime
         #display the total time taken to find a solution
         print ("Solution found in:", runtime, "seconds")
     except IOError as e:
@@ -251,4 +1675,4 @@ def main(argv = None):
     return
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())